@@ -0,0 +1,157 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+###############################################################################
+# Checks that re-running Create Keyframes gives the keys a fresh run would,
+# without Blender.
+#
+#   python benchmarks/check_equivalence.py
+#
+# A re-run only touches the keys that change: it removes the last run's keys
+# that it doesn't replace (see history), leaves alone the ones that are
+# already right, and only samples the source frames that aren't in the
+# source pose cache yet. None of that should make any difference to the keys
+# it ends up with. For each sequence of settings changes, a rig is run
+# through the whole sequence, reusing the cache, and its keys are compared
+# with those of a fresh rig run once with the last settings and an empty
+# cache. Then the rig is run again with the first settings, which has to put
+# back exactly the keys the first run wrote.
+#
+# Every keyframe attribute that the add-on copies is compared exactly, except
+# for the handles. The writer moves a key that's already there by shifting its
+# handles along with it, and fake_bpy's update() doesn't recalculate handles
+# the way Blender's does, so they can be out by float rounding. Each check is
+# done with the F-curves read directly and with scrubbing.
+#
+# Exits with 1 if any check fails. Needs NumPy, like the add-on.
+###############################################################################
+
+import os
+import sys
+
+import numpy as np
+
+import fake_bpy
+fake_bpy.install()
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rigs
+from good_vibrations import cache
+from good_vibrations import engine
+from good_vibrations import history
+from good_vibrations import state
+
+# The size of the rig and of the vibration.
+BONES = 2
+FCURVES_PER_BONE = 10
+KEYS_PER_FCURVE = 25
+FRAMES = 100
+
+DEST_FRAME_START = rigs.vibration_frames(FRAMES)['dest_frame_start']
+
+# The keyframe attributes that only have to be within float rounding of each other (see above).
+HANDLE_ATTRIBUTES = ('handle_left', 'handle_right')
+HANDLE_TOLERANCE = 1e-5
+
+# Sequences of settings runs, as changes to rigs.vibration_frames(FRAMES). The first run of each is the one that
+# gets restored at the end.
+SEQUENCES = (('interval', [{}, {'create_keyframe_frame_interval': 4}]),
+             ('move destination', [{}, {'dest_frame_start': DEST_FRAME_START + 7}]),
+             ('interval and destination', [{}, {'create_keyframe_frame_interval': 3, 'dest_frame_start': DEST_FRAME_START - 5}]),
+             ('stay on', [{}, {'vib_stay_on': 2}, {'vib_stay_on': 3, 'create_keyframe_frame_interval': 2}]),
+             ('decimate', [{'decimate_keys': True}, {'decimate_keys': True, 'create_keyframe_frame_interval': 2}]),
+             ('decimate on and off', [{}, {'decimate_keys': True}, {'create_keyframe_frame_interval': 2}]))
+
+def new_rig(scrub):
+    context = fake_bpy.new_context()
+    obj = rigs.make_rig(context, BONES, FCURVES_PER_BONE, KEYS_PER_FCURVE, FRAMES, scrub)
+    return context, obj
+
+def run(context, changes, source_poses):
+    cache.source_poses = source_poses
+    settings = state.VibrationSettings(vibration_object='Rig', **dict(rigs.vibration_frames(FRAMES), **changes))
+    engine.VibrationJob(context, settings).run()
+
+def keyframes(obj):
+    # Every F-curve's keyframe attributes, as {channel: {attribute: array of values}}.
+    result = {}
+    for fcurve in obj.animation_data.action.fcurves:
+        attributes = {}
+        for name, size, dtype in history.COPIED_KEYFRAME_ATTRIBUTES:
+            values = np.empty(len(fcurve.keyframe_points) * size, dtype=dtype)
+            fcurve.keyframe_points.foreach_get(name, values)
+            attributes[name] = values
+        result[history.channel_id(fcurve)] = attributes
+    return result
+
+def same_keyframes(keyframes, other_keyframes):
+    if keyframes.keys() != other_keyframes.keys():
+        return False
+    for channel, attributes in keyframes.items():
+        for name, values in attributes.items():
+            other_values = other_keyframes[channel][name]
+            if len(values) != len(other_values):
+                return False
+            if name in HANDLE_ATTRIBUTES:
+                if not np.allclose(values, other_values, rtol=0.0, atol=HANDLE_TOLERANCE):
+                    return False
+            elif not np.array_equal(values, other_values):
+                return False
+    return True
+
+def check_sequence(sequence, scrub):
+    # Returns a list of what went wrong.
+    problems = []
+    source_poses = cache.SourcePoseCache()
+    context, obj = new_rig(scrub)
+    run(context, sequence[0], source_poses)
+    first_keyframes = keyframes(obj)
+    for changes in sequence[1:]:
+        run(context, changes, source_poses)
+
+    fresh_context, fresh_obj = new_rig(scrub)
+    run(fresh_context, sequence[-1], cache.SourcePoseCache())
+    if not same_keyframes(keyframes(obj), keyframes(fresh_obj)):
+        problems.append('the re-run differs from a fresh run')
+
+    run(context, sequence[0], source_poses)
+    if not same_keyframes(keyframes(obj), first_keyframes):
+        problems.append('going back to the first settings differs from the first run')
+
+    return problems
+
+def main():
+    saved_source_poses = cache.source_poses
+    failures = 0
+    try:
+        for scrub in (False, True):
+            for name, sequence in SEQUENCES:
+                problems = check_sequence(sequence, scrub)
+                print(('FAILED' if problems else 'ok    ') + '  ' + name + (' (scrubbing)' if scrub else '')
+                      + ''.join(': ' + problem for problem in problems))
+                if problems:
+                    failures += 1
+    finally:
+        cache.source_poses = saved_source_poses
+
+    print(str(failures) + ' of ' + str(2 * len(SEQUENCES)) + ' checks failed' if failures else 'All checks passed')
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,471 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+###############################################################################
+# A stand-in for bpy, just big enough to import the add-on and run its engine
+# under plain Python.
+#
+# It models the parts of the data model the engine touches (objects, pose
+# bones, actions, F-curves and their keyframe points, the scene and view
+# layer) and counts the calls we care about when it comes to performance:
+# operator calls, depsgraph updates, F-curve evaluations and so on. F-curves
+# hold their keys in NumPy arrays and support foreach_get()/foreach_set(), so
+# the bulk code paths work the same way they do in Blender. Bezier segments
+# are evaluated as linear ones; that's close enough for timing, but this is
+# no substitute for checking the results in Blender.
+#
+# Call install() before importing good_vibrations.
+###############################################################################
+
+import sys
+import types
+
+import numpy as np
+
+# What's been called, and how many times. See reset_counters().
+counters = {}
+
+def reset_counters():
+    for name in ('operator_calls',
+                 'depsgraph_updates',
+                 'fcurve_evaluations',
+                 'fcurve_updates',
+                 'keyframe_points_adds',
+                 'keyframe_points_removes',
+                 'foreach_calls',
+                 'registered_classes'):
+        counters[name] = 0
+
+reset_counters()
+
+def count(name, amount=1):
+    counters[name] = counters.get(name, 0) + amount
+
+# Blender's values for the interpolation enum.
+INTERPOLATION_VALUES = {'CONSTANT': 0, 'LINEAR': 1, 'BEZIER': 2}
+
+# How many floats each keyframe point attribute takes up in foreach_get()/foreach_set().
+KEYFRAME_ATTRIBUTE_SIZES = {'co': 2, 'handle_left': 2, 'handle_right': 2, 'interpolation': 1, 'easing': 1,
+                            'back': 1, 'amplitude': 1, 'period': 1, 'handle_left_type': 1, 'handle_right_type': 1}
+
+###############################################################################
+# Animation data
+###############################################################################
+
+class KeyframePoints:
+    def __init__(self):
+        self.arrays = {'co': np.zeros(0, dtype=np.float32),
+                       'handle_left': np.zeros(0, dtype=np.float32),
+                       'handle_right': np.zeros(0, dtype=np.float32),
+                       'interpolation': np.zeros(0, dtype=np.int32),
+                       'easing': np.zeros(0, dtype=np.int32),
+                       'back': np.zeros(0, dtype=np.float32),
+                       'amplitude': np.zeros(0, dtype=np.float32),
+                       'period': np.zeros(0, dtype=np.float32),
+                       'handle_left_type': np.zeros(0, dtype=np.int32),
+                       'handle_right_type': np.zeros(0, dtype=np.int32)}
+
+    def __len__(self):
+        return len(self.arrays['interpolation'])
+
+    def add(self, count_to_add):
+        count('keyframe_points_adds')
+        for name, array in self.arrays.items():
+            self.arrays[name] = np.concatenate((array, np.zeros(count_to_add * KEYFRAME_ATTRIBUTE_SIZES[name], dtype=array.dtype)))
+
+    def __getitem__(self, index):
+        if index < 0 or index >= len(self):
+            raise IndexError(index)
+        return Keyframe(self, index)
+
+    def remove(self, keyframe, fast=False):
+        count('keyframe_points_removes')
+        for name, size in KEYFRAME_ATTRIBUTE_SIZES.items():
+            self.arrays[name] = np.delete(self.arrays[name].reshape(-1, size), keyframe.index, axis=0).reshape(-1)
+
+    def foreach_get(self, name, seq):
+        count('foreach_calls')
+        if len(seq) != len(self.arrays[name]):
+            raise RuntimeError('foreach_get: expected ' + str(len(self.arrays[name])) + ' items, got ' + str(len(seq)))
+        seq[:] = self.arrays[name]
+
+    def foreach_set(self, name, seq):
+        count('foreach_calls')
+        if len(seq) != len(self.arrays[name]):
+            raise RuntimeError('foreach_set: expected ' + str(len(self.arrays[name])) + ' items, got ' + str(len(seq)))
+        self.arrays[name][:] = seq
+
+class FCurve:
+    def __init__(self, data_path, array_index):
+        self.data_path = data_path
+        self.array_index = array_index
+        self.mute = False
+        self.extrapolation = 'CONSTANT'
+        self.modifiers = []
+        self.keyframe_points = KeyframePoints()
+        self.frames = np.zeros(0, dtype=np.float64)  # Sorted copies of the keys, for evaluate(); see update().
+        self.values = np.zeros(0, dtype=np.float64)
+        self.interpolation = np.zeros(0, dtype=np.int32)
+
+    def set_keys(self, frames, values, interpolation='BEZIER'):
+        # Replace all of the keys (used to build the synthetic rigs).
+        keyframe_points = self.keyframe_points
+        keyframe_points.arrays['co'] = np.empty(len(frames) * 2, dtype=np.float32)
+        keyframe_points.arrays['co'][0::2] = frames
+        keyframe_points.arrays['co'][1::2] = values
+        keyframe_points.arrays['handle_left'] = keyframe_points.arrays['co'].copy()
+        keyframe_points.arrays['handle_right'] = keyframe_points.arrays['co'].copy()
+        keyframe_points.arrays['interpolation'] = np.full(len(frames), INTERPOLATION_VALUES[interpolation], dtype=np.int32)
+        keyframe_points.arrays['easing'] = np.zeros(len(frames), dtype=np.int32)
+        for name in ('back', 'amplitude', 'period'):
+            keyframe_points.arrays[name] = np.zeros(len(frames), dtype=np.float32)
+        for name in ('handle_left_type', 'handle_right_type'):
+            keyframe_points.arrays[name] = np.zeros(len(frames), dtype=np.int32)
+        self.update()
+
+    def update(self):
+        # Sort the keys by frame, like Blender does.
+        count('fcurve_updates')
+        arrays = self.keyframe_points.arrays
+        order = np.argsort(arrays['co'][0::2], kind='stable')
+        for name, size in KEYFRAME_ATTRIBUTE_SIZES.items():
+            arrays[name] = arrays[name].reshape(-1, size)[order].reshape(-1)
+        self.frames = arrays['co'][0::2].astype(np.float64)
+        self.values = arrays['co'][1::2].astype(np.float64)
+        self.interpolation = arrays['interpolation'].copy()
+
+    def evaluate(self, frame):
+        count('fcurve_evaluations')
+        frames = self.frames
+        if len(frames) == 0:
+            return 0.0
+        i = int(np.searchsorted(frames, frame, side='right')) - 1
+        if i < 0:
+            return float(self.values[0])
+        if i >= len(frames) - 1 or self.interpolation[i] == INTERPOLATION_VALUES['CONSTANT']:
+            return float(self.values[i])
+        t = (frame - frames[i]) / (frames[i + 1] - frames[i])
+        return float(self.values[i] + (self.values[i + 1] - self.values[i]) * t)
+
+class ActionFCurves(list):
+    def new(self, data_path, index=0):
+        for fcurve in self:
+            if fcurve.data_path == data_path and fcurve.array_index == index:
+                raise RuntimeError('F-Curve ' + data_path + '[' + str(index) + '] already exists')
+        fcurve = FCurve(data_path, index)
+        self.append(fcurve)
+        return fcurve
+
+class Action:
+    def __init__(self, name):
+        self.name = name
+        self.fcurves = ActionFCurves()
+
+class Drivers:
+    def __init__(self):
+        self.fcurves = []
+
+    def find(self, data_path, index=0):
+        for fcurve in self.fcurves:
+            if fcurve.data_path == data_path and fcurve.array_index == index:
+                return fcurve
+        return None
+
+class AnimData:
+    def __init__(self, action):
+        self.action = action
+        self.action_blend_type = 'REPLACE'
+        self.action_influence = 1.0
+        self.use_nla = True
+        self.nla_tracks = []
+        self.drivers = Drivers()
+
+###############################################################################
+# Objects and pose bones
+###############################################################################
+
+class PoseBone:
+    def __init__(self, name):
+        self.name = name
+        self.rotation_mode = 'QUATERNION'
+        self.location = [0.0, 0.0, 0.0]
+        self.rotation_euler = [0.0, 0.0, 0.0]
+        self.rotation_quaternion = [1.0, 0.0, 0.0, 0.0]
+        self.rotation_axis_angle = [0.0, 0.0, 1.0, 0.0]
+        self.scale = [1.0, 1.0, 1.0]
+
+    def path_from_id(self, prop):
+        return 'pose.bones["' + self.name + '"].' + prop
+
+class PoseBones(list):
+    def get(self, name):
+        for bone in self:
+            if bone.name == name:
+                return bone
+        return None
+
+    def foreach_get(self, prop, seq):
+        count('foreach_calls')
+        values = [value for bone in self for value in getattr(bone, prop)]
+        if len(seq) != len(values):
+            raise RuntimeError('foreach_get: expected ' + str(len(values)) + ' items, got ' + str(len(seq)))
+        seq[:] = values
+
+    def foreach_set(self, prop, seq):
+        count('foreach_calls')
+        values = list(seq)
+        size = len(values) // max(len(self), 1)
+        for i, bone in enumerate(self):
+            setattr(bone, prop, values[i * size:(i + 1) * size])
+
+class Pose:
+    def __init__(self, bone_names):
+        self.bones = PoseBones(PoseBone(name) for name in bone_names)
+
+def check_id_property_names(name, value):
+    # Blender won't take an ID property (or a key of a dictionary inside one) with a name of more than 63 characters.
+    if len(name) > 63:
+        raise KeyError('the length of IDProperty names is limited to 63 characters')
+    if isinstance(value, dict):
+        for key, item in value.items():
+            check_id_property_names(key, item)
+    elif isinstance(value, list):
+        for item in value:
+            check_id_property_names('', item)
+
+class Object:
+    def __init__(self, name, bone_names=None):
+        self.name = name
+        self.type = 'EMPTY'
+        self.pose = None
+        if bone_names is not None:
+            self.type = 'ARMATURE'
+            self.pose = Pose(bone_names)
+        self.rotation_mode = 'XYZ'
+        self.location = [0.0, 0.0, 0.0]
+        self.rotation_euler = [0.0, 0.0, 0.0]
+        self.rotation_quaternion = [1.0, 0.0, 0.0, 0.0]
+        self.rotation_axis_angle = [0.0, 0.0, 1.0, 0.0]
+        self.scale = [1.0, 1.0, 1.0]
+        self.animation_data = None
+        self.id_properties = {}
+
+    def __getitem__(self, name):
+        return self.id_properties[name]
+
+    def __setitem__(self, name, value):
+        check_id_property_names(name, value)
+        self.id_properties[name] = value
+
+    def get(self, name, default=None):
+        return self.id_properties.get(name, default)
+
+    def path_resolve(self, data_path, coerce=True):
+        # Only handles the paths the engine uses: a transform property of the object or of one of its pose bones.
+        if data_path.startswith('pose.bones["'):
+            bone_name, prop = data_path[len('pose.bones["'):].split('"].')
+            return getattr(self.pose.bones.get(bone_name), prop)
+        return getattr(self, data_path)
+
+    def evaluate(self, frame):
+        # What the depsgraph does for us in Blender: set every animated property from its F-curve.
+        if self.animation_data is None or self.animation_data.action is None:
+            return
+        for fcurve in self.animation_data.action.fcurves:
+            if not fcurve.mute:
+                self.path_resolve(fcurve.data_path)[fcurve.array_index] = fcurve.evaluate(frame)
+
+class BlendDataObjects(dict):
+    def __iter__(self):
+        return iter(self.values())
+
+class BlendDataActions(dict):
+    def __iter__(self):
+        return iter(self.values())
+
+    def new(self, name):
+        action = Action(name)
+        self[name] = action
+        return action
+
+    def remove(self, action):
+        del self[action.name]
+
+class BlendData:
+    def __init__(self):
+        self.objects = BlendDataObjects()
+        self.actions = BlendDataActions()
+        self.filepath = ''
+
+    def add_object(self, obj):
+        self.objects[obj.name] = obj
+        return obj
+
+###############################################################################
+# Scene, view layer and context
+###############################################################################
+
+class Scene:
+    def __init__(self, blend_data):
+        self.blend_data = blend_data
+        self.frame_current = 1
+
+class ViewLayer:
+    def __init__(self, scene):
+        self.scene = scene
+
+    def update(self):
+        count('depsgraph_updates')
+        for obj in self.scene.blend_data.objects:
+            obj.evaluate(self.scene.frame_current)
+
+class EditPreferences:
+    keyframe_new_interpolation_type = 'BEZIER'
+
+class Preferences:
+    def __init__(self):
+        self.edit = EditPreferences()
+        self.addons = {}
+
+class Context:
+    def __init__(self):
+        self.blend_data = BlendData()
+        self.scene = Scene(self.blend_data)
+        self.view_layer = ViewLayer(self.scene)
+        self.preferences = Preferences()
+
+###############################################################################
+# The bpy module itself
+###############################################################################
+
+class Operators:
+    # bpy.ops: any bpy.ops.category.name() call is counted and otherwise does nothing.
+    def __init__(self, path=''):
+        self.path = path
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return Operators(self.path + '.' + name if self.path else name)
+
+    def __call__(self, *args, **kwargs):
+        count('operator_calls')
+        return {'FINISHED'}
+
+class EnumItem:
+    def __init__(self, value):
+        self.value = value
+
+class RNAProperty:
+    def __init__(self, enum_items):
+        self.enum_items = enum_items
+
+class KeyframeRNA:
+    properties = {'interpolation': RNAProperty(dict((name, EnumItem(value)) for name, value in INTERPOLATION_VALUES.items()))}
+
+class Keyframe:
+    # bpy.types.Keyframe, and also what keyframe_points[i] returns.
+    bl_rna = KeyframeRNA()
+
+    def __init__(self, keyframe_points, index):
+        self.keyframe_points = keyframe_points
+        self.index = index
+
+class StructBase:
+    # Operators, panels, property groups and preferences only need to be subclassable.
+    pass
+
+def make_property(*args, **kwargs):
+    return (args, kwargs)
+
+def register_class(cls):
+    count('registered_classes')
+
+def unregister_class(cls):
+    count('registered_classes', -1)
+
+def persistent(function):
+    return function
+
+# bpy.app.timers never fires here; it only remembers what's registered.
+registered_timers = []
+
+def register_timer(function, first_interval=0.0, persistent=False):
+    registered_timers.append(function)
+
+def unregister_timer(function):
+    registered_timers.remove(function)
+
+def is_timer_registered(function):
+    return function in registered_timers
+
+def new_context():
+    # Start over with an empty scene. Returns the new Context, which is also bpy.context.
+    bpy = sys.modules['bpy']
+    bpy.context = Context()
+    bpy.data = bpy.context.blend_data
+    return bpy.context
+
+def install():
+    # Put bpy (plus mathutils and bmesh, which the add-on imports) in sys.modules. Returns a fresh Context, which is
+    # also bpy.context. Installing more than once does nothing more than new_context().
+    if isinstance(sys.modules.get('bpy'), types.ModuleType) and hasattr(sys.modules['bpy'], 'fake'):
+        return new_context()
+
+    bpy = types.ModuleType('bpy')
+    bpy.fake = True
+    bpy.ops = Operators()
+
+    bpy.types = types.ModuleType('bpy.types')
+    for name in ('Operator', 'Panel', 'PropertyGroup', 'AddonPreferences'):
+        setattr(bpy.types, name, type(name, (StructBase,), {}))
+    bpy.types.Keyframe = Keyframe
+
+    bpy.props = types.ModuleType('bpy.props')
+    for name in ('BoolProperty', 'IntProperty', 'FloatProperty', 'StringProperty', 'EnumProperty',
+                 'PointerProperty', 'CollectionProperty'):
+        setattr(bpy.props, name, make_property)
+
+    bpy.utils = types.ModuleType('bpy.utils')
+    bpy.utils.register_class = register_class
+    bpy.utils.unregister_class = unregister_class
+
+    bpy.app = types.ModuleType('bpy.app')
+    bpy.app.handlers = types.ModuleType('bpy.app.handlers')
+    bpy.app.handlers.persistent = persistent
+    for name in ('depsgraph_update_post', 'frame_change_post', 'load_post', 'undo_post', 'redo_post'):
+        setattr(bpy.app.handlers, name, [])
+    bpy.app.timers = types.ModuleType('bpy.app.timers')
+    bpy.app.timers.register = register_timer
+    bpy.app.timers.unregister = unregister_timer
+    bpy.app.timers.is_registered = is_timer_registered
+
+    bpy.path = types.ModuleType('bpy.path')
+    bpy.path.abspath = lambda path: path
+
+    sys.modules['bpy'] = bpy
+    sys.modules['bpy.types'] = bpy.types
+    sys.modules['bpy.props'] = bpy.props
+    sys.modules['bpy.utils'] = bpy.utils
+    sys.modules['bpy.app'] = bpy.app
+    sys.modules['bpy.app.handlers'] = bpy.app.handlers
+    sys.modules['bpy.app.timers'] = bpy.app.timers
+    sys.modules['bpy.path'] = bpy.path
+    sys.modules['mathutils'] = types.ModuleType('mathutils')
+    sys.modules['bmesh'] = types.ModuleType('bmesh')
+    return new_context()
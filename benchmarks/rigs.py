@@ -0,0 +1,71 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+###############################################################################
+# Synthetic rigs for the benchmarks.
+#
+# make_rig() builds an armature in a fake_bpy context with as many bones,
+# F-curves per bone and keys per F-curve as you like, animated over the
+# frames that a vibration of a given length reads from. The values are
+# smooth but different on every channel, so nothing gets optimized away by
+# accident.
+###############################################################################
+
+import numpy as np
+
+import fake_bpy
+
+# F-curves per bone -> the pose bone properties that are animated.
+FCURVE_PROPS = {3: ('location',),
+                7: ('location', 'rotation_quaternion'),
+                10: ('location', 'rotation_quaternion', 'scale')}
+
+def vibration_frames(number_of_frames):
+    # Where the vibration of a given length reads from and writes to: Vibration #1 starts on frame 1, Vibration #2
+    # right after it, and the destination frames right after that. Returns a dictionary of settings.
+    return {'vib1_frame_start': 1,
+            'vib1_frame_end': number_of_frames,
+            'vib2_frame_start': number_of_frames + 1,
+            'dest_frame_start': number_of_frames * 2 + 10}
+
+def make_rig(context, number_of_bones, fcurves_per_bone, keys_per_fcurve, number_of_frames, scrub=False, name='Rig'):
+    # scrub=True puts a driver on every channel, so the engine can't read the F-curves directly and has to scrub
+    # through the scene instead.
+    if fcurves_per_bone not in FCURVE_PROPS:
+        raise ValueError('fcurves_per_bone must be one of ' + ', '.join(str(n) for n in sorted(FCURVE_PROPS)))
+
+    obj = context.blend_data.add_object(fake_bpy.Object(name, ['bone_' + str(i) for i in range(number_of_bones)]))
+    action = fake_bpy.Action(name + 'Action')
+    obj.animation_data = fake_bpy.AnimData(action)
+
+    # The keys cover both source ranges and the destination range, so writing has existing keys to merge with.
+    last_frame = vibration_frames(number_of_frames)['dest_frame_start'] + number_of_frames + 10
+    frames = np.linspace(1, last_frame, max(keys_per_fcurve, 2))
+
+    channel_number = 0
+    for bone in obj.pose.bones:
+        for prop in FCURVE_PROPS[fcurves_per_bone]:
+            for array_index in range(len(getattr(bone, prop))):
+                fcurve = fake_bpy.FCurve(bone.path_from_id(prop), array_index)
+                fcurve.set_keys(frames, np.sin(frames * 0.1 + channel_number) * (1 + channel_number % 5))
+                action.fcurves.append(fcurve)
+                if scrub:
+                    obj.animation_data.drivers.fcurves.append(fake_bpy.FCurve(fcurve.data_path, array_index))
+                channel_number += 1
+
+    return obj
@@ -0,0 +1,213 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+###############################################################################
+# Benchmarks: how Create Keyframes scales, without Blender.
+#
+#   python benchmarks/run_benchmarks.py [--bones 1,10,50] [--fcurves-per-bone 10]
+#                                       [--keys 25,250] [--frames 100,1000]
+#                                       [--scrub] [--repeat 3]
+#                                       [--json results.json] [--compare baseline.json]
+#
+# Runs the add-on's engine against fake_bpy with a synthetic rig for every
+# combination of sizes, and times the planner, the frame range conflict check
+# (what every panel redraw does), sampling the source frames and writing the
+# keys, and then a re-run with the destination moved (as an animator tweaking
+# the settings would). Times are the best of --repeat runs. The counts (of the
+# first run) come from fake_bpy, so they're exact: depsgraph updates, operator
+# calls and F-curve evaluations.
+#
+# The absolute times are for the fake data model under CPython, not Blender;
+# what they're good for is comparing one version of the add-on with another.
+# Save a run with --json, then --compare a later run against it to get a
+# column with the speedup of each case.
+#
+# Needs NumPy, like the add-on.
+###############################################################################
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import fake_bpy
+fake_bpy.install()
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rigs
+from good_vibrations import cache
+from good_vibrations import engine
+from good_vibrations import planner
+from good_vibrations import state
+
+# How many times to run the (very quick) planner and conflict check per timing.
+QUICK_LOOPS = 1000
+
+# The columns of the scaling table: (heading, result key, format).
+COLUMNS = (('bones', 'bones', '{:d}'),
+           ('fcurves', 'fcurves', '{:d}'),
+           ('keys', 'keys_per_fcurve', '{:d}'),
+           ('frames', 'frames', '{:d}'),
+           ('plan us', 'plan_us', '{:.1f}'),
+           ('conflict us', 'conflict_us', '{:.1f}'),
+           ('sample ms', 'sample_ms', '{:.1f}'),
+           ('write ms', 'write_ms', '{:.1f}'),
+           ('total ms', 'total_ms', '{:.1f}'),
+           ('rerun ms', 'rerun_ms', '{:.1f}'),
+           ('keys written', 'keys_written', '{:d}'),
+           ('evaluations', 'fcurve_evaluations', '{:d}'),
+           ('depsgraph', 'depsgraph_updates', '{:d}'),
+           ('ops', 'operator_calls', '{:d}'))
+
+def time_loops(function, loops):
+    # Average microseconds per call.
+    start_time = time.perf_counter()
+    for i in range(loops):
+        function()
+    return (time.perf_counter() - start_time) / loops * 1e6
+
+def run_job(context, settings):
+    # Returns the job and how long it took to sample and to write, in seconds.
+    job = engine.VibrationJob(context, settings)
+    job.start()
+
+    start_time = time.perf_counter()
+    while job.next_row < len(job.sampler.rows_to_sample):
+        job.step()
+    sample_seconds = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    job.step()
+    write_seconds = time.perf_counter() - start_time
+    job.finish()
+
+    return job, sample_seconds, write_seconds
+
+def run_case(bones, fcurves_per_bone, keys_per_fcurve, frames, scrub):
+    # One run of one case, on a fresh rig, followed by a re-run with a different destination frame (which can use
+    # the source pose cache). Returns a dictionary of results.
+    cache.source_poses.clear()
+    context = fake_bpy.new_context()
+    rigs.make_rig(context, bones, fcurves_per_bone, keys_per_fcurve, frames, scrub)
+    settings = state.VibrationSettings(vibration_object='Rig', **rigs.vibration_frames(frames))
+
+    plan_us = time_loops(lambda: planner.plan_schedule_from_settings(settings), QUICK_LOOPS)
+    conflict_us = time_loops(lambda: state.VibrationState(settings, {'Rig': 'ARMATURE'}), QUICK_LOOPS)
+
+    fake_bpy.reset_counters()
+    job, sample_seconds, write_seconds = run_job(context, settings)
+    counters = dict(fake_bpy.counters)
+
+    settings.dest_frame_start += 5
+    rerun_job, rerun_sample_seconds, rerun_write_seconds = run_job(context, settings)
+
+    return {'bones': bones,
+            'fcurves': bones * fcurves_per_bone,
+            'keys_per_fcurve': keys_per_fcurve,
+            'frames': frames,
+            'plan_us': plan_us,
+            'conflict_us': conflict_us,
+            'sample_ms': sample_seconds * 1000.0,
+            'write_ms': write_seconds * 1000.0,
+            'total_ms': (sample_seconds + write_seconds) * 1000.0,
+            'rerun_ms': (rerun_sample_seconds + rerun_write_seconds) * 1000.0,
+            'keys_written': job.number_of_keys_written,
+            'fcurve_evaluations': counters['fcurve_evaluations'],
+            'depsgraph_updates': counters['depsgraph_updates'],
+            'operator_calls': counters['operator_calls']}
+
+def best_of(results):
+    # The counts are the same every run; the times are the best of the runs.
+    best = dict(results[0])
+    for result in results[1:]:
+        for name in ('plan_us', 'conflict_us', 'sample_ms', 'write_ms', 'total_ms', 'rerun_ms'):
+            best[name] = min(best[name], result[name])
+    return best
+
+def case_key(result):
+    return (result['bones'], result['fcurves'], result['keys_per_fcurve'], result['frames'])
+
+def format_table(results, baseline=None):
+    headings = [heading for heading, name, cell_format in COLUMNS]
+    rows = []
+    for result in results:
+        row = [cell_format.format(result[name]) for heading, name, cell_format in COLUMNS]
+        rows.append(row)
+
+    if baseline is not None:
+        headings.append('vs baseline')
+        baseline_results = dict((case_key(result), result) for result in baseline['results'])
+        for row, result in zip(rows, results):
+            baseline_result = baseline_results.get(case_key(result))
+            if baseline_result is None or result['total_ms'] == 0:
+                row.append('-')
+            else:
+                row.append('{:.2f}x'.format(baseline_result['total_ms'] / result['total_ms']))
+
+    widths = [max(len(heading), max([len(row[i]) for row in rows] or [0])) for i, heading in enumerate(headings)]
+    lines = ['  '.join(heading.rjust(width) for heading, width in zip(headings, widths)),
+             '  '.join('-' * width for width in widths)]
+    for row in rows:
+        lines.append('  '.join(cell.rjust(width) for cell, width in zip(row, widths)))
+    return '\n'.join(lines)
+
+def int_list(text):
+    return [int(value) for value in text.split(',')]
+
+def main():
+    parser = argparse.ArgumentParser(description='Time Good Vibrations against synthetic rigs, without Blender.')
+    parser.add_argument('--bones', type=int_list, default=[1, 10, 50], help='comma separated numbers of bones')
+    parser.add_argument('--fcurves-per-bone', type=int, default=10, choices=sorted(rigs.FCURVE_PROPS), help='animated channels per bone')
+    parser.add_argument('--keys', type=int_list, default=[25, 250], help='comma separated numbers of keys per F-curve')
+    parser.add_argument('--frames', type=int_list, default=[100, 1000], help='comma separated vibration lengths, in frames')
+    parser.add_argument('--scrub', action='store_true', help='drive every channel, so sampling has to scrub the scene')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per case; the best time is reported')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare', help='a --json file from an earlier run to compare against')
+    args = parser.parse_args()
+
+    results = []
+    for bones in args.bones:
+        for keys_per_fcurve in args.keys:
+            for frames in args.frames:
+                runs = [run_case(bones, args.fcurves_per_bone, keys_per_fcurve, frames, args.scrub) for i in range(max(args.repeat, 1))]
+                results.append(best_of(runs))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+
+    print('Good Vibrations benchmarks (' + ('scrubbing' if args.scrub else 'reading F-curves') + ', best of ' + str(args.repeat) + ')')
+    print(format_table(results, baseline))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'python': platform.python_version(),
+                       'platform': platform.platform(),
+                       'scrub': args.scrub,
+                       'repeat': args.repeat,
+                       'results': results}, f, indent=4)
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,98 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+###############################################################################
+# Benchmarks: what enabling the add-on costs at startup, without Blender.
+#
+#   python benchmarks/startup.py [--repeat 20]
+#
+# Times importing the add-on and calling its register(), the way Blender does
+# when it starts up with the add-on enabled. A module is only really imported
+# once per process, so every run is in a fresh Python, with fake_bpy standing
+# in for Blender. Also lists the add-on's modules that got imported.
+#
+# fake_bpy needs NumPy itself, so NumPy is already loaded by the time the
+# add-on is imported. How long NumPy takes to import is timed on its own (in
+# a fresh Python too); in Blender, that's on top of the add-on's time if the
+# add-on is what first imports it.
+#
+# As with the other benchmarks, these are CPython times against the fake data
+# model. Compare one version of the add-on with another, not with Blender.
+###############################################################################
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BENCHMARKS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIRECTORY = os.path.dirname(BENCHMARKS_DIRECTORY)
+
+# What each fresh Python runs to time the add-on. It prints a JSON result.
+REGISTER_SCRIPT = '''
+import json
+import sys
+import time
+
+sys.path[:0] = [{benchmarks!r}, {repository!r}]
+import fake_bpy
+fake_bpy.install()
+
+start_time = time.perf_counter()
+import good_vibrations
+good_vibrations.register()
+seconds = time.perf_counter() - start_time
+
+modules = sorted(name for name in sys.modules if name.startswith('good_vibrations.'))
+print(json.dumps({{'seconds': seconds,
+                   'modules': modules,
+                   'numpy': any(hasattr(sys.modules[name], 'np') for name in modules)}}))
+'''
+
+NUMPY_SCRIPT = '''
+import time
+start_time = time.perf_counter()
+import numpy
+print(time.perf_counter() - start_time)
+'''
+
+def run_python(script):
+    return subprocess.run([sys.executable, '-c', script], check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+
+def main():
+    parser = argparse.ArgumentParser(description='Time importing and registering Good Vibrations, without Blender.')
+    parser.add_argument('--repeat', type=int, default=20, help='fresh Pythons to time it in')
+    args = parser.parse_args()
+
+    register_script = REGISTER_SCRIPT.format(benchmarks=BENCHMARKS_DIRECTORY, repository=REPOSITORY_DIRECTORY)
+    results = [json.loads(run_python(register_script)) for i in range(max(args.repeat, 1))]
+    register_ms = [result['seconds'] * 1000.0 for result in results]
+    numpy_ms = [float(run_python(NUMPY_SCRIPT)) * 1000.0 for i in range(max(args.repeat, 1))]
+
+    print('Good Vibrations startup (' + str(len(results)) + ' fresh Pythons)')
+    print('  import + register:  best {:.2f} ms, median {:.2f} ms'.format(min(register_ms), statistics.median(register_ms)))
+    print('  numpy import:       best {:.2f} ms, median {:.2f} ms'.format(min(numpy_ms), statistics.median(numpy_ms)))
+    print('  add-on needs numpy: ' + ('yes' if results[0]['numpy'] else 'no'))
+    print('  modules imported:   ' + ', '.join(name.split('.', 1)[1] for name in results[0]['modules']))
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
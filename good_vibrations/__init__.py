@@ -16,10 +16,15 @@
 #
 #======================= END GPL LICENSE BLOCK ========================
 
-from mathutils import *
-from bpy.props import *
 import bpy
-import bmesh
+import sys
+import time
+
+# Only what the panel needs is imported up front. The keyframing engine (engine, preview and cache, and NumPy along
+# with them) is imported inside the operators the first time one of them runs, so having the add-on enabled costs next
+# to nothing at startup. Code that runs all the time (the handlers, the panel) uses loaded_module() instead, so it
+# never imports the engine just to find out there's nothing to do.
+from . import state
 
 # Version history
 # 1.0.0 - 2022-04-08: Original version.
@@ -45,68 +50,107 @@ bl_info = {
     "tracker_url": "https://github.com/sundriftproductions/blenderaddon-good-vibrations",
     "category": "3D View"}
 
-def set_obnoxious_headers_when_autokeying(self):
-    # The obnoxious_autokeying_headers add-on does not work when the autokeying setting is changed via code; it only
-    # gets triggered when you click on the UI. So we're imitating the behavior of that add-on here; when we change
-    # the state of the autokeying setting, it's very, very obvious in Blender.
-    if bpy.context.scene.tool_settings.use_keyframe_insert_auto == True:
-        bpy.context.preferences.themes[0].dopesheet_editor.space.header = (1.000000, 0.000000, 0.000000, 1.000000)
-        bpy.context.preferences.themes[0].graph_editor.space.header = (1.000000, 0.000000, 0.000000, 1.000000)
-        bpy.context.preferences.themes[0].nla_editor.space.header = (1.000000, 0.000000, 0.000000, 1.000000)
-        bpy.context.preferences.themes[0].image_editor.space.header = (1.000000, 0.000000, 0.000000, 1.000000)
-        bpy.context.preferences.themes[0].sequence_editor.space.header = (1.000000, 0.000000, 0.000000, 1.000000)
-        bpy.context.preferences.themes[0].text_editor.space.header = (1.000000, 0.000000, 0.000000, 1.000000)
-        bpy.context.preferences.themes[0].node_editor.space.header = (1.000000, 0.000000, 0.000000, 1.000000)
-        bpy.context.preferences.themes[0].properties.space.header = (1.000000, 0.000000, 0.000000, 1.000000)
-        bpy.context.preferences.themes[0].outliner.space.header = (1.000000, 0.000000, 0.000000, 1.000000)
-        bpy.context.preferences.themes[0].info.space.header = (1.000000, 0.000000, 0.000000, 1.000000)
-        bpy.context.preferences.themes[0].console.space.header = (1.000000, 0.000000, 0.000000, 1.000000)
-        bpy.context.preferences.themes[0].clip_editor.space.header = (1.000000, 0.000000, 0.000000, 1.000000)
-        bpy.context.preferences.themes[0].topbar.space.header = (1.000000, 0.000000, 0.000000, 1.000000)
-    else:
-        bpy.context.preferences.themes[0].dopesheet_editor.space.header = (0.137255, 0.137255, 0.137255, 1.000000)
-        bpy.context.preferences.themes[0].graph_editor.space.header = (0.137255, 0.137255, 0.137255, 1.000000)
-        bpy.context.preferences.themes[0].nla_editor.space.header = (0.137255, 0.137255, 0.137255, 1.000000)
-        bpy.context.preferences.themes[0].image_editor.space.header = (0.137255, 0.137255, 0.137255, 1.000000)
-        bpy.context.preferences.themes[0].sequence_editor.space.header = (0.137255, 0.137255, 0.137255, 1.000000)
-        bpy.context.preferences.themes[0].text_editor.space.header = (0.137255, 0.137255, 0.137255, 1.000000)
-        bpy.context.preferences.themes[0].node_editor.space.header = (0.137255, 0.137255, 0.137255, 1.000000)
-        bpy.context.preferences.themes[0].properties.space.header = (0.137255, 0.137255, 0.137255, 1.000000)
-        bpy.context.preferences.themes[0].outliner.space.header = (0.137255, 0.137255, 0.137255, 1.000000)
-        bpy.context.preferences.themes[0].info.space.header = (0.137255, 0.137255, 0.137255, 1.000000)
-        bpy.context.preferences.themes[0].console.space.header = (0.137255, 0.137255, 0.137255, 1.000000)
-        bpy.context.preferences.themes[0].clip_editor.space.header = (0.137255, 0.137255, 0.137255, 1.000000)
-        bpy.context.preferences.themes[0].topbar.space.header = (0.137255, 0.137255, 0.137255, 1.000000)
-
-def select_name( name = "", extend = True ):
-    if extend == False:
-        bpy.ops.object.select_all(action='DESELECT')
-    ob = bpy.data.objects.get(name)
-    ob.select_set(state=True)
-    bpy.context.view_layer.objects.active = ob
-
-def DoFrameRangesConflict():
-    if bpy.context.preferences.addons['good_vibrations'].preferences.vib1_frame_end < bpy.context.preferences.addons['good_vibrations'].preferences.vib1_frame_start:
-        vib1_frame_start = bpy.context.preferences.addons['good_vibrations'].preferences.vib1_frame_end
-        vib1_frame_end = bpy.context.preferences.addons['good_vibrations'].preferences.vib1_frame_start
-    else:
-        vib1_frame_start = bpy.context.preferences.addons['good_vibrations'].preferences.vib1_frame_start
-        vib1_frame_end = bpy.context.preferences.addons['good_vibrations'].preferences.vib1_frame_end
+# How long (in seconds) the Create Keyframes operator works for each time its timer fires, when run from the UI.
+CHUNK_TIME_BUDGET = 0.1
 
-    vib2_frame_start = bpy.context.preferences.addons['good_vibrations'].preferences.vib1_frame_start
-    vib2_frame_end = bpy.context.preferences.addons['good_vibrations'].preferences.vib1_frame_start + (vib1_frame_end - vib1_frame_start)
+# The state that the panel and the operators work from. It's only rebuilt after something it depends on changes (one
+# of the preferences, or the objects in the scene), not on every redraw of the panel.
+vibration_state_cache = None
 
-    dest_frame_start = bpy.context.preferences.addons['good_vibrations'].preferences.dest_frame_start
-    dest_frame_end = bpy.context.preferences.addons['good_vibrations'].preferences.dest_frame_start + (vib1_frame_end - vib1_frame_start)
+def loaded_module(name):
+    # One of our submodules if something has imported it already, or None.
+    return sys.modules.get(__name__ + '.' + name)
 
-    for dest_frame in range(dest_frame_start, dest_frame_end + 1):
-        for vib1_frame in range(vib1_frame_start, vib1_frame_end + 1):
-            if vib1_frame == dest_frame: return True
+def is_previewing():
+    preview = loaded_module('preview')
+    return preview is not None and preview.is_active()
 
-        for vib2_frame in range(vib2_frame_start, vib2_frame_end + 1):
-            if vib2_frame == dest_frame: return True
+def invalidate_vibration_state(self=None, context=None):
+    global vibration_state_cache
+    vibration_state_cache = None
 
-    return False
+    if self is not None and is_previewing() and not bpy.app.timers.is_registered(refresh_preview):
+        # One of the settings changed, so the preview needs rebuilding. That might mean scrubbing the scene, which we
+        # can't do from inside a property update, so it's done from a timer.
+        bpy.app.timers.register(refresh_preview, first_interval=0.1)
+
+def refresh_preview():
+    # Rebuild the preview from the current settings. The source poses are usually cached, so this is quick.
+    from . import engine
+    from . import preview
+    if preview.is_active():
+        try:
+            preview.start(bpy.context, GetVibrationState().settings)
+        except engine.VibrationError:
+            preview.stop(bpy.context.scene)
+    return None  # Don't run again.
+
+def GetVibrationState():
+    global vibration_state_cache
+    if vibration_state_cache is None:
+        settings = state.VibrationSettings.from_preferences(bpy.context.preferences.addons['good_vibrations'].preferences)
+        object_types = {}
+        for target in settings.targets():
+            obj = bpy.data.objects.get(target.vibration_object)
+            if obj is not None:
+                object_types[obj.name] = obj.type
+        vibration_state_cache = state.VibrationState(settings, object_types)
+    return vibration_state_cache
+
+@bpy.app.handlers.persistent
+def depsgraph_update_post_handler(scene, depsgraph):
+    # Objects may have been added, removed, renamed or changed type.
+    if depsgraph.id_type_updated('OBJECT'):
+        invalidate_vibration_state()
+
+@bpy.app.handlers.persistent
+def invalidate_vibration_state_handler(*args):
+    # We're looking at a whole different set of objects after loading a file or undoing.
+    invalidate_vibration_state()
+    preview = loaded_module('preview')
+    if preview is not None:
+        preview.stop()
+
+@bpy.app.handlers.persistent
+def frame_change_post_handler(scene, *args):
+    preview = loaded_module('preview')
+    if preview is not None and preview.active_preview is not None:
+        preview.active_preview.apply(scene.frame_current)
+
+@bpy.app.handlers.persistent
+def clear_source_pose_cache_handler(*args):
+    # The cached poses belong to the objects of the file we had open.
+    cache = loaded_module('cache')
+    if cache is not None:
+        cache.source_poses.clear()
+
+def report_job_results(operator, job):
+    # Report how a finished job went in the Info log (and the timings record, if there is one).
+    from . import instrumentation
+    if job.settings.output_mode == 'NLA':
+        operator.report({'INFO'}, '  Wrote ' + str(job.number_of_keys_written) + ' keyframes into the NLA strips of ' + str(len(job.targets)) + ' target(s).')
+    else:
+        operator.report({'INFO'}, '  Wrote ' + str(job.number_of_keys_written) + ' keyframes (' + str(job.number_of_keys_unchanged) + ' were already there, ' + str(job.number_of_keys_removed) + ' left over from the last run were removed).')
+    if job.settings.decimate_keys:
+        operator.report({'INFO'}, '  Left out ' + str(job.number_of_keys_decimated) + ' redundant keyframes.')
+
+    preferences = bpy.context.preferences.addons['good_vibrations'].preferences
+    if preferences.report_timings:
+        operator.report({'INFO'}, '  Timings:')
+        for line in job.stats.summary_lines():
+            operator.report({'INFO'}, '  ' + line)
+
+    if preferences.timings_filepath != '':
+        record = {'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                  'file': bpy.data.filepath,
+                  'objects': [obj.name for obj, channels in job.targets],
+                  'dest_frame_start': job.schedule.dest_frame_start,
+                  'dest_frame_end': job.schedule.dest_frame_end,
+                  'stats': job.stats.to_dict()}
+        try:
+            instrumentation.append_json_record(bpy.path.abspath(preferences.timings_filepath), record)
+        except OSError as e:
+            operator.report({'WARNING'}, '  WARNING: Couldn\'t write the timings record: ' + str(e))
 
 class GOODVIBRATIONS_PT_Vib1RecordStartFrame(bpy.types.Operator):
     bl_idname = "vibr.vib1_record_start_frame"
@@ -140,232 +184,238 @@ class GOODVIBRATIONS_PT_DestRecordStartFrame(bpy.types.Operator):
         bpy.context.preferences.addons['good_vibrations'].preferences.dest_frame_start = bpy.context.scene.frame_current
         return {'FINISHED'}
 
+class GOODVIBRATIONS_PT_AddTarget(bpy.types.Operator):
+    bl_idname = "vibr.add_target"
+    bl_label = "Add Target"
+    bl_description = "Vibrate another object or bone over the same frames"
+
+    def execute(self, context):
+        bpy.context.preferences.addons['good_vibrations'].preferences.extra_targets.add()
+        invalidate_vibration_state()
+        return {'FINISHED'}
+
+class GOODVIBRATIONS_PT_RemoveTarget(bpy.types.Operator):
+    bl_idname = "vibr.remove_target"
+    bl_label = "Remove Target"
+    bl_description = "Stop vibrating this object or bone"
+    index: bpy.props.IntProperty()
+
+    def execute(self, context):
+        bpy.context.preferences.addons['good_vibrations'].preferences.extra_targets.remove(self.index)
+        invalidate_vibration_state()
+        return {'FINISHED'}
+
 class GOODVIBRATIONS_PT_CreateKeyframes(bpy.types.Operator):
     bl_idname = "vibr.create_keyframes"
     bl_label = "Create Keyframes"
     bl_options = {"REGISTER", "UNDO"} # Required for when we do a bpy.ops.ed.undo_push(), otherwise Blender will crash when you try to undo the action in this class.
 
-    def execute(self, context):
+    @classmethod
+    def poll(cls, context):
+        return GetVibrationState().is_valid
+
+    def start_job(self, context):
+        # Returns False if the job couldn't be started.
         self.report({'INFO'}, '**********************************')
         self.report({'INFO'}, SCRIPT_NAME + ' - START')
 
+        from . import engine
+        from . import preview
+        if preview.is_active():
+            preview.stop(context.scene)
+
         bpy.ops.ed.undo_push()  # Manually record that when we do an undo, we want to go back to this exact state.
 
-        ########## INPUT PARAMS #############
-        obj_name = bpy.context.preferences.addons['good_vibrations'].preferences.vibration_object
-        bone_name = bpy.context.preferences.addons['good_vibrations'].preferences.vibration_bone
+        self.job = engine.VibrationJob(context, GetVibrationState().settings)
+        try:
+            self.job.start()
+        except engine.VibrationError as e:
+            self.report({'ERROR'}, '  ERROR: ' + str(e))
+            return False
+
+        for warning in self.job.warnings:
+            self.report({'WARNING'}, '  WARNING: ' + warning + ' Skipping it.')
 
-        if bpy.context.preferences.addons['good_vibrations'].preferences.vib1_frame_end < bpy.context.preferences.addons['good_vibrations'].preferences.vib1_frame_start:
-            vib1_frame_start = bpy.context.preferences.addons['good_vibrations'].preferences.vib1_frame_end
-            vib1_frame_end = bpy.context.preferences.addons['good_vibrations'].preferences.vib1_frame_start
+        if self.job.sampler.needs_sampling():
+            self.report({'INFO'}, '  Sampling ' + str(len(self.job.sampler.rows_to_sample)) + ' source frames for ' + str(len(self.job.sampler.targets_to_sample)) + ' target(s)...')
         else:
-            vib1_frame_start = bpy.context.preferences.addons['good_vibrations'].preferences.vib1_frame_start
-            vib1_frame_end = bpy.context.preferences.addons['good_vibrations'].preferences.vib1_frame_end
+            self.report({'INFO'}, '  Reusing the source poses sampled last time for ' + str(len(self.job.targets)) + ' target(s)...')
+        return True
+
+    def finish_job(self):
+        report_job_results(self, self.job)
+
+        self.report({'INFO'}, SCRIPT_NAME + ' - END')
+        self.report({'INFO'}, '**********************************')
+        self.report({'INFO'}, 'Done running script ' + SCRIPT_NAME)
 
-        if vib1_frame_start == vib1_frame_end:
-            self.report({'ERROR'}, '  ERROR: Vibration #1 Start Frame and End Frame cannot be the same frame.')
+    def execute(self, context):
+        if not self.start_job(context):
             return {'CANCELLED'}
 
-        vib2_frame_start = bpy.context.preferences.addons['good_vibrations'].preferences.vib2_frame_start
-        output_frame_start = bpy.context.preferences.addons['good_vibrations'].preferences.dest_frame_start
-        frames_to_stay_on_vibrate = bpy.context.preferences.addons['good_vibrations'].preferences.vib_stay_on
-        create_keyframe_every_x_frames = bpy.context.preferences.addons['good_vibrations'].preferences.create_keyframe_frame_interval
-        flag_object_location = bpy.context.preferences.addons['good_vibrations'].preferences.vibration_object_location
-        flag_object_rotation = bpy.context.preferences.addons['good_vibrations'].preferences.vibration_object_rotation
-        flag_object_scale = bpy.context.preferences.addons['good_vibrations'].preferences.vibration_object_scale
-        flag_bone_location = bpy.context.preferences.addons['good_vibrations'].preferences.vibration_bone_location
-        flag_bone_rotation = bpy.context.preferences.addons['good_vibrations'].preferences.vibration_bone_rotation
-        flag_bone_scale = bpy.context.preferences.addons['good_vibrations'].preferences.vibration_bone_scale
-        #####################################
+        while not self.job.step():
+            pass
+        self.job.finish()
 
-        using_vib1 = True  # Always start with using vib1.
+        self.finish_job()
+        return {'FINISHED'}
 
-        # Remember our original state for use_keyframe_insert_auto, so we can restore it at the end.
-        original_use_keyframe_insert_auto = bpy.context.scene.tool_settings.use_keyframe_insert_auto
+    def invoke(self, context, event):
+        # From the UI, we do the work in chunks from a timer, so Blender stays responsive, shows the progress, and
+        # lets you cancel with Esc.
+        if not self.start_job(context):
+            return {'CANCELLED'}
 
-        # Remember our original frame number so we can restore it at the end.
-        original_current_frame = bpy.context.scene.frame_current
+        context.window_manager.progress_begin(0, 100)
+        self.timer = context.window_manager.event_timer_add(0.01, window=context.window)
+        context.window_manager.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
 
-        # Remember our original mode so we can restore it at the end.
-        original_mode = bpy.context.active_object.mode
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self.job.cancel()
+            self.end_modal(context)
+            self.report({'WARNING'}, SCRIPT_NAME + ' - CANCELLED; no keyframes were written.')
+            return {'CANCELLED'}
 
-        bpy.ops.object.mode_set(mode='OBJECT')
-        bpy.ops.object.select_all(action='DESELECT')
-        select_name(obj_name)
-        bpy.context.view_layer.update()
+        if event.type != 'TIMER':
+            if event.type in {'MIDDLEMOUSE', 'WHEELUPMOUSE', 'WHEELDOWNMOUSE', 'TRACKPADPAN', 'TRACKPADZOOM'}:
+                return {'PASS_THROUGH'}  # Let the viewport be navigated while we work...
+            return {'RUNNING_MODAL'}  # ...but nothing else, since that could change the animation out from under us.
 
-        obj = bpy.data.objects[obj_name]
+        # Work until we've used up this chunk's time budget.
+        chunk_end_time = time.perf_counter() + CHUNK_TIME_BUDGET
+        done = False
+        try:
+            while not done and time.perf_counter() < chunk_end_time:
+                done = self.job.step()
+            if done:
+                self.job.finish()
+        except:
+            self.end_modal(context)  # Don't leave the timer, progress bar and status text behind.
+            raise
 
-        if obj.type == 'ARMATURE':
-            # Remember the state of all of the bone layers, so we can restore things to how they were at the end.
-            original_bone_layers = [False, False, False, False, False, False, False, False, False, False, False,
-                                    False, False, False, False, False, False, False, False, False, False, False,
-                                    False, False, False, False, False, False, False, False, False, False]
-            for i in range(0, 32):
-                original_bone_layers[i] = obj.data.layers[i]
+        if done:
+            self.end_modal(context)
+            self.finish_job()
+            return {'FINISHED'}
 
-            # Now that we stored the state of the bone layers, show them all.
-            for i in range(0, 32):
-                obj.data.layers[i] = True
+        context.window_manager.progress_update(int(self.job.progress() * 100))
+        context.workspace.status_text_set(SCRIPT_NAME + ': ' + self.job.status_text() + ' (Esc to cancel)')
+        return {'RUNNING_MODAL'}
 
-            bpy.ops.object.mode_set(mode='POSE')
+    def end_modal(self, context):
+        context.window_manager.event_timer_remove(self.timer)
+        context.window_manager.progress_end()
+        context.workspace.status_text_set(None)
 
-            if bpy.context.object.data.pose_position == 'REST':
-                self.report({'WARNING'},
-                            '  WARNING: The rig is in REST position. We are automatically going to switch it to POSE position so we can move bones around.')
-                bpy.context.object.data.pose_position = 'POSE'
+class GOODVIBRATIONS_PT_Preview(bpy.types.Operator):
+    bl_idname = "vibr.preview"
+    bl_label = "Preview"
+    bl_description = "Show the vibration on the Destination Frames as you scrub or play, without creating any keyframes. Click again to stop"
 
-        bpy.context.scene.tool_settings.use_keyframe_insert_auto = True
+    @classmethod
+    def poll(cls, context):
+        return is_previewing() or GetVibrationState().is_valid
 
-        self.report({'INFO'}, '  Walling off the beginning and ending of the destination frames...')
-        bpy.context.scene.frame_set(output_frame_start)
+    def execute(self, context):
+        from . import engine
+        from . import preview
+        if preview.is_active():
+            preview.stop(context.scene)
+            return {'FINISHED'}
 
-        # Wall off the beginning.
         try:
-            if obj.type == 'ARMATURE':
-                bpy.ops.object.mode_set(mode='OBJECT')  # We can't use the "Available" key set in Pose Mode; we have to dip into Object Mode for a moment.
-                # bpy.context.view_layer.update()
-                bpy.ops.anim.keyframe_insert_menu(type='Available', confirm_success=True)
-                bpy.ops.object.mode_set(mode='POSE')
-            else:
-                bpy.ops.anim.keyframe_insert_menu(type='Available', confirm_success=True)
-        except: # If we have no animation data to copy, 'Available' won't be an option. We only need to check the first time we try this.
-            self.report({'ERROR'}, "No existing animation data to copy for '" + obj_name + "'!")
-            if obj.type == 'ARMATURE':
-                # Restore the original bone layer states.
-                for i in range(0, 32):
-                    obj.data.layers[i] = original_bone_layers[i]
-            bpy.context.scene.tool_settings.use_keyframe_insert_auto = original_use_keyframe_insert_auto
-            set_obnoxious_headers_when_autokeying(self)  # ...and change back our headers to however they should be.
-            bpy.context.scene.frame_current = original_current_frame
-            bpy.context.view_layer.update()
-            bpy.ops.object.mode_set(mode=original_mode) # Go back to whatever mode we were in.
+            preview.start(context, GetVibrationState().settings)
+        except engine.VibrationError as e:
+            self.report({'ERROR'}, str(e))
             return {'CANCELLED'}
 
-        # Wall off the ending.
-        bpy.context.scene.frame_set(output_frame_start + (vib1_frame_end - vib1_frame_start))
-        if obj.type == 'ARMATURE':
-            bpy.ops.object.mode_set(mode='OBJECT')  # We can't use the "Available" key set in Pose Mode; we have to dip into Object Mode for a moment.
-            # bpy.context.view_layer.update()
-            bpy.ops.anim.keyframe_insert_menu(type='Available', confirm_success=True)
-            bpy.ops.object.mode_set(mode='POSE')
-        else:
-            bpy.ops.anim.keyframe_insert_menu(type='Available', confirm_success=True)
-
-        self.report({'INFO'}, '  Writing destination frames...')
-        number_of_frames_on_a_vibrate = 0
-
-        for offset in range(0, vib1_frame_end - vib1_frame_start + 1):
-            if offset % create_keyframe_every_x_frames == 0:
-                # It's OK to write a frame.
-                if using_vib1:
-                    frame = vib1_frame_start + offset
-                else:
-                    frame = vib2_frame_start + offset
-
-                bpy.context.scene.frame_current = frame
-                bpy.context.view_layer.update()
-
-                locationAll = obj.location.copy()
-                rotation_eulerAll = obj.rotation_euler.copy()
-                rotation_quaternionAll = obj.rotation_quaternion.copy()
-                scaleAll = obj.scale.copy()
-
-                if obj.type == 'ARMATURE':
-                    all_bone_info = []
-                    for bone in obj.pose.bones[:]:
-                        if bone_name == None or bone_name == '' or bone_name == bone.name:
-                            bone_info = [bone.name, bone.location.copy(), bone.rotation_euler.copy(), bone.rotation_quaternion.copy(), bone.scale.copy()]
-                            all_bone_info.append(bone_info)
-
-                # Now go to the frame where we want to write the keyframe and make the appropriate changes to the object.
-                frame_to_write_to = output_frame_start + offset
-                bpy.context.scene.frame_current = frame_to_write_to
-                bpy.context.view_layer.update()
-
-                # Set the object location/scale/rotation appropriately.
-                if flag_object_location:
-                    obj.location = locationAll
-
-                if flag_object_rotation:
-                    obj.rotation_euler = rotation_eulerAll
-                    obj.rotation_quaternion = rotation_quaternionAll
-
-                if flag_object_scale:
-                    obj.scale = scaleAll
-
-                if obj.type == 'ARMATURE':
-                    for bone_info in all_bone_info:
-                        if flag_bone_location:
-                            obj.pose.bones[bone_info[0]].location = bone_info[1]
-
-                        if flag_bone_rotation:
-                            obj.pose.bones[bone_info[0]].rotation_euler = bone_info[2]
-                            obj.pose.bones[bone_info[0]].rotation_quaternion = bone_info[3]
-
-                        if flag_bone_scale:
-                            obj.pose.bones[bone_info[0]].scale = bone_info[4]
-
-                if obj.type == 'ARMATURE':
-                    bpy.ops.object.mode_set(mode='OBJECT') # We can't use the "Available" key set in Pose Mode; we have to dip into Object Mode for a moment.
-                    #bpy.context.view_layer.update()
-                    bpy.ops.anim.keyframe_insert_menu(type='Available', confirm_success=True)
-                    bpy.ops.object.mode_set(mode='POSE')
-                else:
-                    bpy.ops.anim.keyframe_insert_menu(type='Available', confirm_success=True)
-
-                # Now let's find ONLY the keyframes we just inserted and ensure that those interpolation types are set to CONSTANT.
-                for fcu in obj.animation_data.action.fcurves:
-                    for keyframe in fcu.keyframe_points:
-                        frame = keyframe.co[0]
-                        # self.report({'INFO'}, (str(dir(keyframe))))
-
-                        if frame == frame_to_write_to:
-                            keyframe.interpolation = 'CONSTANT'  # This changes the interpolation.
-
-            number_of_frames_on_a_vibrate += 1
-            if number_of_frames_on_a_vibrate >= frames_to_stay_on_vibrate:
-                number_of_frames_on_a_vibrate = 0
-                using_vib1 = not using_vib1  # Use the other vibration range on the next iteration.
-
-        if obj.type == 'ARMATURE':
-            # Restore the original bone layer states.
-            for i in range(0, 32):
-               obj.data.layers[i] = original_bone_layers[i]
-
-        # Restore the original use_keyframe_insert_auto.
-        bpy.context.scene.tool_settings.use_keyframe_insert_auto = original_use_keyframe_insert_auto
-        set_obnoxious_headers_when_autokeying(self)  # ...and change back our headers to however they should be.
-        bpy.context.scene.frame_current = original_current_frame
-        bpy.context.view_layer.update()
-        bpy.ops.object.mode_set(mode=original_mode)  # Go back to whatever mode we were in.
+        for warning in preview.active_preview.job.warnings:
+            self.report({'WARNING'}, warning + ' Skipping it.')
+        return {'FINISHED'}
 
-        self.report({'INFO'}, SCRIPT_NAME + ' - END')
+class GOODVIBRATIONS_PT_CommitPreview(bpy.types.Operator):
+    bl_idname = "vibr.commit_preview"
+    bl_label = "Commit"
+    bl_description = "Create the keyframes for the vibration being previewed"
+    bl_options = {"REGISTER", "UNDO"}
+
+    @classmethod
+    def poll(cls, context):
+        return is_previewing() and GetVibrationState().is_valid
+
+    def execute(self, context):
+        from . import preview
         self.report({'INFO'}, '**********************************')
-        self.report({'INFO'}, 'Done running script ' + SCRIPT_NAME)
+        self.report({'INFO'}, SCRIPT_NAME + ' - COMMIT PREVIEW')
+
+        bpy.ops.ed.undo_push()  # Manually record that when we do an undo, we want to go back to this exact state.
+
+        if bpy.app.timers.is_registered(refresh_preview):
+            # The settings changed since the preview was made.
+            bpy.app.timers.unregister(refresh_preview)
+            refresh_preview()
+            if not preview.is_active():
+                self.report({'ERROR'}, '  ERROR: The preview is out of date and could not be rebuilt.')
+                return {'CANCELLED'}
+
+        job = preview.active_preview.job
+        preview.active_preview.commit()
+        preview.stop(context.scene)
 
+        report_job_results(self, job)
+        self.report({'INFO'}, SCRIPT_NAME + ' - END')
+        self.report({'INFO'}, '**********************************')
         return {'FINISHED'}
 
+class GoodVibrationsTarget(bpy.types.PropertyGroup):
+    # An extra object (or bone) to vibrate along with the main one.
+    vibration_object: bpy.props.StringProperty(name="Object", description='Which object should vibrate', update=invalidate_vibration_state)
+    vibration_object_location: bpy.props.BoolProperty(default=True, description="Vibrate object location", update=invalidate_vibration_state)
+    vibration_object_rotation: bpy.props.BoolProperty(default=True, description="Vibrate object rotation", update=invalidate_vibration_state)
+    vibration_object_scale: bpy.props.BoolProperty(default=True, description="Vibrate object scale", update=invalidate_vibration_state)
+    vibration_bone: bpy.props.StringProperty(name="Bone", description='Which bone should vibrate? Leave empty if all bones should vibrate', update=invalidate_vibration_state)
+    vibration_bone_location: bpy.props.BoolProperty(default=True, description="Vibrate bone location", update=invalidate_vibration_state)
+    vibration_bone_rotation: bpy.props.BoolProperty(default=True, description="Vibrate bone rotation", update=invalidate_vibration_state)
+    vibration_bone_scale: bpy.props.BoolProperty(default=True, description="Vibrate bone scale", update=invalidate_vibration_state)
+
 class GoodVibrationsPreferencesPanel(bpy.types.AddonPreferences):
     bl_idname = __module__
-    vibration_object: bpy.props.StringProperty(name="Object", description='Which object should vibrate')
-    vibration_object_location: bpy.props.BoolProperty(default=True, description="Vibrate object location")
-    vibration_object_rotation: bpy.props.BoolProperty(default=True, description="Vibrate object rotation")
-    vibration_object_scale: bpy.props.BoolProperty(default=True, description="Vibrate object scale")
-    vibration_bone: bpy.props.StringProperty(name="Bone", description='Which bone should vibrate? Leave empty if all bones should vibrate')
-    vibration_bone_location: bpy.props.BoolProperty(default=True, description="Vibrate bone location")
-    vibration_bone_rotation: bpy.props.BoolProperty(default=True, description="Vibrate bone rotation")
-    vibration_bone_scale: bpy.props.BoolProperty(default=True, description="Vibrate bone scale")
-    vib1_frame_start: bpy.props.IntProperty(name='Start Frame', default=301, description='The frame where Vibration #1 starts')
-    vib1_frame_end: bpy.props.IntProperty(name='End Frame', default=400, description='The frame where Vibration #1 ends')
-    vib2_frame_start: bpy.props.IntProperty(name='Start Frame', default=401, description='The frame where Vibration #2 starts')
-    vib_stay_on: bpy.props.IntProperty(name='Switch Vibration Frame Interval', default=1, description='How many frames should we continue pulling keys from either Vibration #1 or Vibration #2 before switching to the other vibration')
-    dest_frame_start: bpy.props.IntProperty(name='Start Frame', default=101, description='The frame where the new keyframes will start')
-    create_keyframe_frame_interval: bpy.props.IntProperty(name='Create Keyframe Frame Interval', default=1, description='How often do we create a keyframe in the Destination Frames output')
+    vibration_object: bpy.props.StringProperty(name="Object", description='Which object should vibrate', update=invalidate_vibration_state)
+    vibration_object_location: bpy.props.BoolProperty(default=True, description="Vibrate object location", update=invalidate_vibration_state)
+    vibration_object_rotation: bpy.props.BoolProperty(default=True, description="Vibrate object rotation", update=invalidate_vibration_state)
+    vibration_object_scale: bpy.props.BoolProperty(default=True, description="Vibrate object scale", update=invalidate_vibration_state)
+    vibration_bone: bpy.props.StringProperty(name="Bone", description='Which bone should vibrate? Leave empty if all bones should vibrate', update=invalidate_vibration_state)
+    vibration_bone_location: bpy.props.BoolProperty(default=True, description="Vibrate bone location", update=invalidate_vibration_state)
+    vibration_bone_rotation: bpy.props.BoolProperty(default=True, description="Vibrate bone rotation", update=invalidate_vibration_state)
+    vibration_bone_scale: bpy.props.BoolProperty(default=True, description="Vibrate bone scale", update=invalidate_vibration_state)
+    vib1_frame_start: bpy.props.IntProperty(name='Start Frame', default=301, description='The frame where Vibration #1 starts', update=invalidate_vibration_state)
+    vib1_frame_end: bpy.props.IntProperty(name='End Frame', default=400, description='The frame where Vibration #1 ends', update=invalidate_vibration_state)
+    vib2_frame_start: bpy.props.IntProperty(name='Start Frame', default=401, description='The frame where Vibration #2 starts', update=invalidate_vibration_state)
+    vib_stay_on: bpy.props.IntProperty(name='Switch Vibration Frame Interval', default=1, min=1, description='How many frames should we continue pulling keys from either Vibration #1 or Vibration #2 before switching to the other vibration', update=invalidate_vibration_state)
+    dest_frame_start: bpy.props.IntProperty(name='Start Frame', default=101, description='The frame where the new keyframes will start', update=invalidate_vibration_state)
+    create_keyframe_frame_interval: bpy.props.IntProperty(name='Create Keyframe Frame Interval', default=1, min=1, description='How often do we create a keyframe in the Destination Frames output', update=invalidate_vibration_state)
+    output_mode: bpy.props.EnumProperty(name='Output',
+                                        items=[('KEYS', 'Keyframes', "Key the vibration into each object's own action"),
+                                               ('NLA', 'NLA Strip', "Build the vibration as an action of its own, played from an NLA strip over the Destination Frames; the object's action is pushed down onto an NLA track but otherwise left untouched")],
+                                        default='KEYS',
+                                        description='Where the vibration is written',
+                                        update=invalidate_vibration_state)
+    decimate_keys: bpy.props.BoolProperty(name='Remove Redundant Keyframes', default=False, description="Leave out keyframes that hold the same value as the keyframe before them, since they don't change anything", update=invalidate_vibration_state)
+    decimate_tolerance: bpy.props.FloatProperty(name='Tolerance', default=0.0001, min=0.0, precision=5, description='How close two values have to be for the second keyframe to count as redundant', update=invalidate_vibration_state)
+    extra_targets: bpy.props.CollectionProperty(type=GoodVibrationsTarget)
+    report_timings: bpy.props.BoolProperty(name='Report Timings', default=False, description='After creating keyframes, list how long each part of the job took (and how much work it did) in the Info log')
+    timings_filepath: bpy.props.StringProperty(name='Timings Log', subtype='FILE_PATH', description='If set, a JSON record of every Create Keyframes run (timings and counts) is appended to this file')
 
     def draw(self, context):
         self.layout.label(text="Current values")
 
+        row = self.layout.row(align=True)
+        row.prop(self, "report_timings")
+        row = self.layout.row(align=True)
+        row.prop(self, "timings_filepath")
+
 class GOODVIBRATIONS_PT_Main(bpy.types.Panel):
     bl_idname = "GOODVIBRATIONS_PT_Main"
     bl_label = "Good Vibrations"
@@ -373,46 +423,54 @@ class GOODVIBRATIONS_PT_Main(bpy.types.Panel):
     bl_region_type = "UI"
     bl_category = "Animation"
 
+    def draw_target(self, box, target, vibration_state):
+        # target is either the preferences (for the main target) or one of the extra targets.
+        object_type = vibration_state.object_types.get(target.vibration_object)
+
+        icon_type = 'OBJECT_DATA'
+        if object_type == 'ARMATURE':
+            icon_type = 'ARMATURE_DATA'
+
+        row = box.row(align=True)
+        row.prop_search(target, "vibration_object", bpy.data, "objects", icon=icon_type)
+
+        row = box.row(align=True)
+        row.prop(target, "vibration_object_location", text="Location")
+        row.prop(target, "vibration_object_rotation", text="Rotation")
+        row.prop(target, "vibration_object_scale", text="Scale")
+
+        # The object types are cached, so the object might have been renamed or deleted since.
+        obj = bpy.data.objects.get(target.vibration_object)
+        if object_type == 'ARMATURE' and obj is not None and obj.type == 'ARMATURE':
+            row = box.row(align=True)
+            row.prop_search(target, "vibration_bone", obj.data, "bones", icon='BONE_DATA')
+
+            row = box.row(align=True)
+            row.prop(target, "vibration_bone_location", text="Location")
+            row.prop(target, "vibration_bone_rotation", text="Rotation")
+            row.prop(target, "vibration_bone_scale", text="Scale")
+
     def draw(self, context):
-        do_frame_ranges_conflict = DoFrameRangesConflict()
+        preferences = context.preferences.addons['good_vibrations'].preferences
+        vibration_state = GetVibrationState()
 
         box = self.layout.box()
         row = box.row(align=True)
         row.label(text="Object to Vibrate")
 
-        icon_type = 'OBJECT_DATA'
-        try:
-            obj = bpy.data.objects[bpy.context.preferences.addons['good_vibrations'].preferences.vibration_object]
-            if obj is not None:
-                if obj.type == 'ARMATURE':
-                    icon_type = 'ARMATURE_DATA'
-        except:
-            pass
+        self.draw_target(box, preferences, vibration_state)
 
         row = box.row(align=True)
-        row.prop_search(bpy.context.preferences.addons['good_vibrations'].preferences, "vibration_object", bpy.data, "objects", icon=icon_type)
 
-        row = box.row(align=True)
-        row.prop(bpy.context.preferences.addons['good_vibrations'].preferences, "vibration_object_location", text="Location")
-        row.prop(bpy.context.preferences.addons['good_vibrations'].preferences, "vibration_object_rotation", text="Rotation")
-        row.prop(bpy.context.preferences.addons['good_vibrations'].preferences, "vibration_object_scale", text="Scale")
-
-        try:
-            obj = bpy.data.objects[bpy.context.preferences.addons['good_vibrations'].preferences.vibration_object]
-            if obj is not None:
-                if obj.type == 'ARMATURE':
-                    armature = obj.data
-                    row = box.row(align=True)
-                    row.prop_search(bpy.context.preferences.addons['good_vibrations'].preferences, "vibration_bone", armature, "bones", icon='BONE_DATA')
-
-                    row = box.row(align=True)
-                    row.prop(bpy.context.preferences.addons['good_vibrations'].preferences, "vibration_bone_location", text="Location")
-                    row.prop(bpy.context.preferences.addons['good_vibrations'].preferences, "vibration_bone_rotation", text="Rotation")
-                    row.prop(bpy.context.preferences.addons['good_vibrations'].preferences, "vibration_bone_scale", text="Scale")
-        except:
-            pass
+        for i, extra_target in enumerate(preferences.extra_targets):
+            target_box = box.box()
+            row = target_box.row(align=True)
+            row.label(text="Extra Target #" + str(i + 1))
+            row.operator("vibr.remove_target", text="", icon='X', emboss=False).index = i
+            self.draw_target(target_box, extra_target, vibration_state)
 
         row = box.row(align=True)
+        row.operator("vibr.add_target", icon='ADD')
 
         box = self.layout.box()
         row = box.row(align=True)
@@ -422,8 +480,8 @@ class GOODVIBRATIONS_PT_Main(bpy.types.Panel):
         row.label(text="Vibration #1")
 
         row = box.row(align=True)
-        row.prop(bpy.context.preferences.addons['good_vibrations'].preferences, "vib1_frame_start")
-        row.prop(bpy.context.preferences.addons['good_vibrations'].preferences, "vib1_frame_end")
+        row.prop(preferences, "vib1_frame_start")
+        row.prop(preferences, "vib1_frame_end")
 
         row = box.row(align=True)
         row.operator("vibr.vib1_record_start_frame", text='Start Frame', icon='TRIA_UP')
@@ -431,17 +489,11 @@ class GOODVIBRATIONS_PT_Main(bpy.types.Panel):
 
         row = box.row(align=True)
 
-        if bpy.context.preferences.addons['good_vibrations'].preferences.vib1_frame_end < bpy.context.preferences.addons['good_vibrations'].preferences.vib1_frame_start:
-            total_number_of_frames = bpy.context.preferences.addons['good_vibrations'].preferences.vib1_frame_start - bpy.context.preferences.addons['good_vibrations'].preferences.vib1_frame_end
-        else:
-            total_number_of_frames = bpy.context.preferences.addons['good_vibrations'].preferences.vib1_frame_end - bpy.context.preferences.addons['good_vibrations'].preferences.vib1_frame_start
-
         row = box.row(align=True)
         row.label(text="Vibration #2")
         row = box.row(align=True)
-        row.prop(bpy.context.preferences.addons['good_vibrations'].preferences, "vib2_frame_start")
-        end_frame = total_number_of_frames + bpy.context.preferences.addons['good_vibrations'].preferences.vib2_frame_start
-        row.label(text=" End Frame: " + str(end_frame))
+        row.prop(preferences, "vib2_frame_start")
+        row.label(text=" End Frame: " + str(vibration_state.vib2_range[1]))
 
         row = box.row(align=True)
         row.operator("vibr.vib2_record_start_frame", text='Start Frame', icon='TRIA_UP')
@@ -450,62 +502,96 @@ class GOODVIBRATIONS_PT_Main(bpy.types.Panel):
         row = box.row(align=True)
 
         row = box.row(align=True)
-        row.prop(bpy.context.preferences.addons['good_vibrations'].preferences, "vib_stay_on")
+        row.prop(preferences, "vib_stay_on")
 
         box = self.layout.box()
         row = box.row(align=True)
         row.label(text="Destination Frames")
 
         row = box.row(align=True)
-        row.prop(bpy.context.preferences.addons['good_vibrations'].preferences, "dest_frame_start")
-        end_frame = total_number_of_frames + bpy.context.preferences.addons['good_vibrations'].preferences.dest_frame_start
-        row.label(text=" End Frame: " + str(end_frame))
+        row.prop(preferences, "dest_frame_start")
+        row.label(text=" End Frame: " + str(vibration_state.dest_range[1]))
 
         row = box.row(align=True)
         row.operator("vibr.dest_record_start_frame", text='Start Frame', icon='TRIA_UP')
-        if do_frame_ranges_conflict:
+        if vibration_state.do_frame_ranges_conflict:
             row.label(text="*** CONFLICT WITH SOURCE FRAMES! ***")
+            for conflict in vibration_state.conflicts:
+                row = box.row(align=True)
+                row.label(text="Overlaps " + conflict.range_name + " on frames " + str(conflict.frame_start) + "-" + str(conflict.frame_end) + " (" + str(conflict.number_of_frames) + " frames)", icon='ERROR')
         else:
             row.label(text=" ")
 
         row = box.row(align=True)
         row = box.row(align=True)
-        row.prop(bpy.context.preferences.addons['good_vibrations'].preferences, "create_keyframe_frame_interval")
+        row.prop(preferences, "create_keyframe_frame_interval")
+
+        row = box.row(align=True)
+        row.prop(preferences, "output_mode", expand=True)
+
+        row = box.row(align=True)
+        row.prop(preferences, "decimate_keys")
+        sub = row.row(align=True)
+        sub.prop(preferences, "decimate_tolerance")
+        sub.enabled = preferences.decimate_keys
 
         row = self.layout.row(align=True)
         row.operator("vibr.create_keyframes",icon='KEYFRAME')
 
-        # Now let's see if we have any invalid parameters so that we would need to disable the Create Keyframes button.
-        if do_frame_ranges_conflict == True:
-            row.enabled = False
+        # If we have any invalid parameters, disable the Create Keyframes button.
+        row.enabled = vibration_state.is_valid
+
+        row = self.layout.row(align=True)
+        if is_previewing():
+            row.operator("vibr.preview", text="Stop Preview", icon='HIDE_OFF', depress=True)
         else:
-            if bpy.context.preferences.addons['good_vibrations'].preferences.vibration_object == None or bpy.context.preferences.addons['good_vibrations'].preferences.vibration_object == "":
-                row.enabled = False
-            else:
-                try:
-                    obj = bpy.data.objects[bpy.context.preferences.addons['good_vibrations'].preferences.vibration_object]
-                    if obj is None:
-                        row.enabled = False
-                except:
-                    row.enabled = False
+            row.operator("vibr.preview", icon='HIDE_OFF')
+        row.operator("vibr.commit_preview", icon='CHECKMARK')
 
 def register():
+    bpy.utils.register_class(GoodVibrationsTarget)
     bpy.utils.register_class(GoodVibrationsPreferencesPanel)
+    bpy.utils.register_class(GOODVIBRATIONS_PT_AddTarget)
+    bpy.utils.register_class(GOODVIBRATIONS_PT_RemoveTarget)
     bpy.utils.register_class(GOODVIBRATIONS_PT_CreateKeyframes)
+    bpy.utils.register_class(GOODVIBRATIONS_PT_Preview)
+    bpy.utils.register_class(GOODVIBRATIONS_PT_CommitPreview)
     bpy.utils.register_class(GOODVIBRATIONS_PT_Vib1RecordStartFrame)
     bpy.utils.register_class(GOODVIBRATIONS_PT_Vib1RecordEndFrame)
     bpy.utils.register_class(GOODVIBRATIONS_PT_Vib2RecordStartFrame)
     bpy.utils.register_class(GOODVIBRATIONS_PT_DestRecordStartFrame)
     bpy.utils.register_class(GOODVIBRATIONS_PT_Main)
+    bpy.app.handlers.depsgraph_update_post.append(depsgraph_update_post_handler)
+    bpy.app.handlers.load_post.append(invalidate_vibration_state_handler)
+    bpy.app.handlers.load_post.append(clear_source_pose_cache_handler)
+    bpy.app.handlers.undo_post.append(invalidate_vibration_state_handler)
+    bpy.app.handlers.redo_post.append(invalidate_vibration_state_handler)
+    bpy.app.handlers.frame_change_post.append(frame_change_post_handler)
 
 def unregister():
     bpy.utils.unregister_class(GoodVibrationsPreferencesPanel)
+    bpy.utils.unregister_class(GoodVibrationsTarget)
+    bpy.utils.unregister_class(GOODVIBRATIONS_PT_AddTarget)
+    bpy.utils.unregister_class(GOODVIBRATIONS_PT_RemoveTarget)
     bpy.utils.unregister_class(GOODVIBRATIONS_PT_CreateKeyframes)
+    bpy.utils.unregister_class(GOODVIBRATIONS_PT_Preview)
+    bpy.utils.unregister_class(GOODVIBRATIONS_PT_CommitPreview)
     bpy.utils.unregister_class(GOODVIBRATIONS_PT_Vib1RecordStartFrame)
     bpy.utils.unregister_class(GOODVIBRATIONS_PT_Vib1RecordEndFrame)
     bpy.utils.unregister_class(GOODVIBRATIONS_PT_Vib2RecordStartFrame)
     bpy.utils.unregister_class(GOODVIBRATIONS_PT_DestRecordStartFrame)
     bpy.utils.unregister_class(GOODVIBRATIONS_PT_Main)
+    bpy.app.handlers.depsgraph_update_post.remove(depsgraph_update_post_handler)
+    bpy.app.handlers.load_post.remove(invalidate_vibration_state_handler)
+    bpy.app.handlers.load_post.remove(clear_source_pose_cache_handler)
+    bpy.app.handlers.undo_post.remove(invalidate_vibration_state_handler)
+    bpy.app.handlers.redo_post.remove(invalidate_vibration_state_handler)
+    bpy.app.handlers.frame_change_post.remove(frame_change_post_handler)
+    if bpy.app.timers.is_registered(refresh_preview):
+        bpy.app.timers.unregister(refresh_preview)
+    preview = loaded_module('preview')
+    if preview is not None:
+        preview.stop()
 
 if __name__ == "__main__":
     register()
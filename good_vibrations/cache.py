@@ -0,0 +1,163 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+###############################################################################
+# Source pose cache.
+#
+# Animators tend to run Create Keyframes over and over against the same
+# source animation while they tweak the destination frame, the switch
+# interval or the keyframe interval. The source poses don't change between
+# those runs, so we keep the values we sampled, per object, action and set of
+# channels and source ranges, one row per source frame. A run only samples
+# the frames that aren't in the cache yet, and adds them to it. So after a
+# change to the switch interval or the keyframe interval, only the source
+# frames that no earlier run used get sampled, and a run that only needs
+# frames we've already sampled doesn't sample anything at all.
+#
+# An entry is only used if a fingerprint of its F-curves still matches: a
+# hash of every key that affects the values inside the source ranges. Keys
+# elsewhere (like the ones we write into the destination frames) don't
+# count, but editing the source animation throws the entry away. Only
+# channels that are read straight from their F-curves are cached; anything
+# that has to be scrubbed depends on more than the action. The cache holds at
+# most MAX_CACHE_BYTES of samples, dropping the least recently used entries
+# first.
+###############################################################################
+
+import collections
+import hashlib
+
+import numpy as np
+
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+
+# The keyframe point attributes that affect what an F-curve evaluates to, with how many values each takes up in
+# foreach_get() and their types.
+KEYFRAME_ATTRIBUTES = (('co', 2, np.float32),
+                       ('handle_left', 2, np.float32),
+                       ('handle_right', 2, np.float32),
+                       ('interpolation', 1, np.int32),
+                       ('easing', 1, np.int32),
+                       ('back', 1, np.float32),  # For BACK keys...
+                       ('amplitude', 1, np.float32),  # ...and ELASTIC ones.
+                       ('period', 1, np.float32))
+
+def fcurve_fingerprint(fcurve, source_ranges, digest):
+    # Feed everything about an F-curve that affects its values on the frames in source_ranges (a list of inclusive
+    # (start, end) ranges) into digest: the keys inside each range, plus the key on either side of it. Returns
+    # False if the F-curve has something we don't fingerprint (modifiers), in which case it mustn't be cached.
+    if len(fcurve.modifiers) > 0:
+        return False
+
+    keyframe_points = fcurve.keyframe_points
+    count = len(keyframe_points)
+    digest.update(str((fcurve.data_path, fcurve.array_index, fcurve.extrapolation)).encode())
+
+    arrays = {}
+    for name, size, dtype in KEYFRAME_ATTRIBUTES:
+        arrays[name] = np.empty(count * size, dtype=dtype).reshape(count, size)
+        keyframe_points.foreach_get(name, arrays[name].reshape(-1))
+
+    key_frames = arrays['co'][:, 0]
+    for frame_start, frame_end in source_ranges:
+        first = max(int(np.searchsorted(key_frames, frame_start, side='right')) - 1, 0)
+        last = min(int(np.searchsorted(key_frames, frame_end, side='left')) + 1, count)
+        # Whether the range runs off either end of the F-curve matters too, since that's where extrapolation kicks in.
+        digest.update(str((first == 0, last == count)).encode())
+        for name, size, dtype in KEYFRAME_ATTRIBUTES:
+            digest.update(arrays[name][first:last].tobytes())
+
+    return True
+
+def channels_fingerprint(channels, source_ranges):
+    # A fingerprint of the F-curves of a list of sampling.Channels, or None if they can't be cached.
+    digest = hashlib.blake2b(digest_size=16)
+    for channel in channels:
+        if channel.needs_scrub or not fcurve_fingerprint(channel.fcurve, source_ranges, digest):
+            return None
+    return digest.hexdigest()
+
+def cache_key(obj, action, channels, source_ranges):
+    return (obj.name,
+            action.name,
+            tuple(source_ranges),
+            tuple((channel.data_path, channel.array_index) for channel in channels))
+
+class CacheEntry:
+    def __init__(self, fingerprint, frames, samples):
+        self.fingerprint = fingerprint
+        self.frames = frames  # Sorted source frames...
+        self.samples = samples  # ...and one row of channel values for each of them.
+
+    def number_of_bytes(self):
+        return self.frames.nbytes + self.samples.nbytes
+
+class SourcePoseCache:
+    def __init__(self, max_bytes=MAX_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()  # {cache_key(): CacheEntry}, least recently used first.
+        self.number_of_bytes = 0
+
+    def clear(self):
+        self.entries.clear()
+        self.number_of_bytes = 0
+
+    def get(self, key, fingerprint, frames):
+        # The cached samples for frames (one row per frame) and a boolean array saying which of the rows we have; the
+        # rows we don't have are zeros. None if we don't have any of them.
+        entry = self.entries.get(key)
+        if entry is None or entry.fingerprint != fingerprint or len(entry.frames) == 0:
+            return None
+
+        frames = np.asarray(frames)
+        rows = np.minimum(np.searchsorted(entry.frames, frames), len(entry.frames) - 1)
+        found = entry.frames[rows] == frames
+        if not np.any(found):
+            return None
+
+        self.entries.move_to_end(key)
+        samples = entry.samples[rows]
+        samples[np.logical_not(found)] = 0.0
+        return (samples, found)
+
+    def put(self, key, fingerprint, frames, samples):
+        # Remember the samples for frames, along with any other frames we already have for the same F-curves.
+        frames = np.asarray(frames)
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.number_of_bytes -= entry.number_of_bytes()
+            if entry.fingerprint == fingerprint:
+                frames = np.concatenate((entry.frames, frames))
+                samples = np.concatenate((entry.samples, samples))
+
+        # Keep one row per frame (the newest), sorted by frame.
+        frames, rows = np.unique(frames[::-1], return_index=True)
+        samples = samples[::-1][rows]
+
+        entry = CacheEntry(fingerprint, frames, samples)
+        if entry.number_of_bytes() > self.max_bytes:
+            return
+
+        self.entries[key] = entry
+        self.number_of_bytes += entry.number_of_bytes()
+        while self.number_of_bytes > self.max_bytes:
+            key, entry = self.entries.popitem(last=False)
+            self.number_of_bytes -= entry.number_of_bytes()
+
+# The cache that every job shares. It's cleared whenever a file is loaded.
+source_poses = SourcePoseCache()
@@ -0,0 +1,138 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+###############################################################################
+# Command line entry point, for creating vibrations without the UI.
+#
+#   blender -b shot.blend --python-exit-code 1 --python-expr "import sys, good_vibrations.cli; sys.exit(good_vibrations.cli.main())" -- job.json [--result result.json]
+#
+# main() returns the exit code (0 if the vibration was created, 1 if not, 2
+# for bad arguments), so pass it to sys.exit() as above or Blender will
+# exit with 0 whatever happened.
+# (If the add-on isn't installed, put the folder that contains good_vibrations
+# on sys.path first; scripts/batch_vibrate.py does that for you.)
+#
+# The job file is JSON (or YAML, if PyYAML is available) and uses the same
+# names as the add-on's preferences, e.g.:
+#
+#   {"vibration_object": "Rig", "vibration_bone": "head",
+#    "vib1_frame_start": 301, "vib1_frame_end": 400, "vib2_frame_start": 401,
+#    "dest_frame_start": 101, "vib_stay_on": 1, "create_keyframe_frame_interval": 1,
+#    "output_mode": "KEYS", "decimate_keys": false, "decimate_tolerance": 0.0001,
+#    "extra_targets": [{"vibration_object": "Prop"}],
+#    "output": "shot_vibrated.blend"}
+#
+# Anything that's left out gets the same default as in the preferences. The
+# result is saved over the .blend file, or to "output" if there is one (set
+# "save" to false to not save at all). A JSON summary of what happened is
+# written to the --result file, or printed if there isn't one.
+###############################################################################
+
+import json
+import os
+import sys
+import time
+
+import bpy
+
+from . import engine
+from . import state
+
+def load_job_file(filepath):
+    with open(filepath, 'r') as f:
+        if os.path.splitext(filepath)[1].lower() in ('.yaml', '.yml'):
+            import yaml  # Only needed for YAML job files, so we don't insist on it.
+            return yaml.safe_load(f)
+        return json.load(f)
+
+def run_job(job_spec):
+    # Create the vibration described by job_spec in the currently open .blend file. Returns a dictionary
+    # describing what happened.
+    job_spec = dict(job_spec)
+    output = job_spec.pop('output', None)
+    save = job_spec.pop('save', True)
+
+    result = {'file': bpy.data.filepath,
+              'status': 'ok',
+              'error': None,
+              'warnings': [],
+              'keys_written': 0,
+              'keys_unchanged': 0,
+              'keys_removed': 0,
+              'keys_decimated': 0,
+              'seconds': 0.0}
+
+    start_time = time.perf_counter()
+    try:
+        settings = state.VibrationSettings.from_dict(job_spec)
+        job = engine.VibrationJob(bpy.context, settings)
+        job.run()
+    except (ValueError, TypeError, engine.VibrationError) as e:
+        result['status'] = 'error'
+        result['error'] = str(e)
+        result['seconds'] = time.perf_counter() - start_time
+        return result
+
+    result['warnings'] = job.warnings
+    result['keys_written'] = job.number_of_keys_written
+    result['keys_unchanged'] = job.number_of_keys_unchanged
+    result['keys_removed'] = job.number_of_keys_removed
+    result['keys_decimated'] = job.number_of_keys_decimated
+    result['stats'] = job.stats.to_dict()
+    result['seconds'] = time.perf_counter() - start_time
+
+    if output:
+        bpy.ops.wm.save_as_mainfile(filepath=output)
+        result['output'] = output
+    elif save:
+        bpy.ops.wm.save_mainfile()
+        result['output'] = bpy.data.filepath
+
+    return result
+
+def main(argv=None):
+    # Arguments are whatever comes after the '--' on Blender's command line.
+    if argv is None:
+        argv = sys.argv
+        if '--' in argv:
+            argv = argv[argv.index('--') + 1:]
+        else:
+            argv = []
+
+    result_filepath = None
+    if '--result' in argv:
+        i = argv.index('--result')
+        result_filepath = argv[i + 1]
+        argv = argv[:i] + argv[i + 2:]
+
+    if len(argv) != 1:
+        print('usage: blender -b file.blend --python-exit-code 1 --python-expr "import sys, good_vibrations.cli; sys.exit(good_vibrations.cli.main())" -- job.json [--result result.json]')
+        return 2
+
+    result = run_job(load_job_file(argv[0]))
+    result['job'] = argv[0]
+
+    if result_filepath is None:
+        print(json.dumps(result, indent=4))
+    else:
+        with open(result_filepath, 'w') as f:
+            json.dump(result, f, indent=4)
+
+    if result['status'] != 'ok':
+        return 1
+    return 0
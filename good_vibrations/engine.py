@@ -0,0 +1,258 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+###############################################################################
+# The keyframing engine.
+#
+# A VibrationJob takes a state.VibrationSettings and creates the vibration for
+# all of its targets in small steps: one step per source frame to sample (for
+# every target at once), then a single step that writes every key. Nothing is
+# written until that last step, so a job that's cancelled part of the way
+# through leaves the animation untouched.
+###############################################################################
+
+from . import cache
+from . import history
+from . import instrumentation
+from . import nla
+from . import planner
+from . import ranges
+from . import sampling
+from . import writer
+
+class VibrationError(Exception):
+    # Something about the settings or the scene means we can't create the vibration.
+    pass
+
+class VibrationJob:
+    def __init__(self, context, settings):
+        # We hang on to the scene and view layer rather than the context, since a modal operator gets a fresh
+        # context every time it's called.
+        self.scene = context.scene
+        self.view_layer = context.view_layer
+        self.blend_data = context.blend_data
+        self.default_interpolation = context.preferences.edit.keyframe_new_interpolation_type
+        self.settings = settings
+
+        self.schedule = None
+        self.targets = []  # A list of (object, list of sampling.Channels), one for each target we're vibrating.
+        self.warnings = []  # Targets we had to skip, and why.
+        self.sampler = None
+        self.next_row = 0  # How many of the sampler's rows_to_sample we've sampled so far.
+        self.number_of_keys_written = 0
+        self.number_of_keys_unchanged = 0  # Keys that were already there with the right value.
+        self.number_of_keys_removed = 0  # Keys from the last run that this one didn't replace.
+        self.number_of_keys_decimated = 0  # Keys we left out because they wouldn't have changed anything.
+        self.original_current_frame = None
+        self.stats = instrumentation.RunStats()
+
+    def start(self):
+        # Raises a VibrationError if there's nothing we can do.
+        settings = self.settings
+
+        with self.stats.phase('plan'):
+            # The panel won't let you create keyframes over the source frames, so neither will we. This covers
+            # anything that doesn't go through the panel: the CLI, and a preview whose settings have changed.
+            conflicts = ranges.frame_range_conflicts(settings.vib1_frame_start, settings.vib1_frame_end,
+                                                     settings.vib2_frame_start, settings.dest_frame_start)
+            if len(conflicts) > 0:
+                raise VibrationError('The Destination Frames overlap ' + ' and '.join(conflict.range_name + ' on frames ' + str(conflict.frame_start) + '-' + str(conflict.frame_end) for conflict in conflicts) + '.')
+
+            try:
+                self.schedule = planner.plan_schedule_from_settings(settings)
+            except ValueError as e:
+                raise VibrationError(str(e))
+
+        with self.stats.phase('find channels'):
+            self.find_targets()
+
+        # Everything from here on reads and writes the object's data directly, so we never need to change the mode,
+        # the selection, the visible bone layers or the auto-keying setting, or pose the rig. The only thing we
+        # might change is the current frame (if we have to scrub), so remember it so we can restore it at the end.
+        self.original_current_frame = self.scene.frame_current
+
+        # Every source frame is sampled once, for all of the targets together, except the ones that are already
+        # cached from an earlier run.
+        vib1_range = ranges.vib1_frame_range(settings.vib1_frame_start, settings.vib1_frame_end)
+        source_ranges = [vib1_range, ranges.offset_frame_range(vib1_range, settings.vib2_frame_start)]
+        self.sampler = sampling.SourceSampler(self.scene, self.view_layer, self.targets, self.schedule.source_frames, self.stats,
+                                              cache.source_poses, source_ranges)
+
+    def find_targets(self):
+        for target in self.settings.targets():
+            obj = self.blend_data.objects.get(target.vibration_object)
+            if obj is None:
+                raise VibrationError("There's no object named '" + target.vibration_object + "'!")
+
+            if sampling.source_action(obj.animation_data) is None:
+                self.warnings.append("No existing animation data to copy for '" + target.vibration_object + "'!")
+                continue
+
+            object_props = sampling.transform_props(target.vibration_object_location, target.vibration_object_rotation, target.vibration_object_scale)
+            bone_props = sampling.transform_props(target.vibration_bone_location, target.vibration_bone_rotation, target.vibration_bone_scale)
+            channels = sampling.find_channels(obj, sampling.target_data_paths(obj, target.vibration_bone, object_props, bone_props))
+            if len(channels) == 0:
+                self.warnings.append("None of the channels chosen to vibrate are animated on '" + target.vibration_object + "'!")
+                continue
+
+            self.targets.append((obj, channels))
+            self.stats.count('targets')
+            self.stats.count('channels', len(channels))
+
+        if len(self.targets) == 0:
+            if len(self.warnings) == 1:
+                raise VibrationError(self.warnings[0])
+            raise VibrationError('None of the targets have any animated channels to vibrate!')
+
+    def number_of_steps(self):
+        return len(self.sampler.rows_to_sample) + 1
+
+    def progress(self):
+        # How far along we are, from 0.0 to 1.0.
+        return self.next_row / self.number_of_steps()
+
+    def status_text(self):
+        if self.next_row < len(self.sampler.rows_to_sample):
+            return 'Sampling source frame ' + str(self.next_row + 1) + ' of ' + str(len(self.sampler.rows_to_sample))
+        return 'Writing keyframes'
+
+    def step(self):
+        # Do the next bit of work. Returns True once the job is done.
+        if self.next_row < len(self.sampler.rows_to_sample):
+            self.sampler.sample(self.sampler.rows_to_sample[self.next_row])
+            self.next_row += 1
+            return False
+
+        self.write()
+        return True
+
+    def sample(self):
+        # Sample every source frame, but don't write anything (for a preview). Puts the frame back afterwards.
+        # The samples go into the cache straight away, so rebuilding the preview after a change of settings is quick.
+        while self.next_row < len(self.sampler.rows_to_sample):
+            self.step()
+        self.sampler.cache_samples()
+        self.restore()
+
+    def write(self):
+        # We only key the F-curves we're actually vibrating; every other channel is left alone. Nothing actually gets
+        # written until the very end, so every value we read from the F-curves here is from the untouched animation.
+        self.sampler.cache_samples()
+
+        with self.stats.phase('write keys'):
+            if self.settings.output_mode == 'NLA':
+                self.write_strips()
+            else:
+                self.write_keys()
+
+    def decimate_tolerance(self):
+        # What to pass to writer.KeyframeWriter.
+        if self.settings.decimate_keys:
+            return self.settings.decimate_tolerance
+        return None
+
+    def write_strips(self):
+        # Each target gets an action of its own, played from an NLA strip; the source actions aren't touched.
+        for target_sampler in self.sampler.targets:
+            number_of_keys_written, number_of_keys_decimated = nla.write_strip(target_sampler.obj, target_sampler.channels, target_sampler.samples,
+                                                                               self.schedule, self.settings.create_keyframe_frame_interval,
+                                                                               self.decimate_tolerance())
+            self.number_of_keys_written += number_of_keys_written
+            self.number_of_keys_decimated += number_of_keys_decimated
+            self.stats.count('fcurves_touched', len(target_sampler.channels))
+            self.stats.count('keys_written', number_of_keys_written)
+            self.stats.count('keys_decimated', number_of_keys_decimated)
+
+    def write_keys(self):
+        # After an earlier run in NLA Strip mode, the source action needs to be the active action again, and the
+        # vibration strip would hide the keys.
+        for target_sampler in self.sampler.targets:
+            nla.pull_up_source(target_sampler.obj.animation_data)
+            nla.mute_vibration_track(target_sampler.obj.animation_data)
+
+        key_writer = writer.KeyframeWriter(self.default_interpolation, self.decimate_tolerance())
+
+        # What the last run wrote into each target, as {history.channel_id(): list of frames}.
+        records = [history.load_record(target_sampler.obj, target_sampler.action) for target_sampler in self.sampler.targets]
+
+        # Wall off the beginning and ending of the destination frames, with the values the animation had there before
+        # any vibration was written. These go in first, so that vibration keys on the same frames replace them.
+        wall_frames = (self.schedule.dest_frame_start, self.schedule.dest_frame_end)
+        unrecorded_values = history.UnrecordedValues()
+        try:
+            for target_sampler, record in zip(self.sampler.targets, records):
+                for channel in target_sampler.channels:
+                    recorded_frames = record.get(history.channel_id(channel.fcurve), [])
+                    values = unrecorded_values.evaluate(channel.fcurve, wall_frames, recorded_frames)
+                    for wall_frame, value in zip(wall_frames, values):
+                        # A key of ours on the wall frame wouldn't be there on a first run, so the wall would be a new
+                        # key with the default interpolation, rather than keep the interpolation of the key it replaces.
+                        interpolation = None
+                        if wall_frame in recorded_frames:
+                            interpolation = self.default_interpolation
+                        key_writer.add(channel.fcurve, wall_frame, value, interpolation)
+        finally:
+            unrecorded_values.remove()
+
+        for target_sampler in self.sampler.targets:
+            for i, channel in enumerate(target_sampler.channels):
+                key_writer.add_keys(channel.fcurve, self.schedule.dest_frames, target_sampler.samples[:, i], 'CONSTANT', decimate=True)
+
+        # Whatever the last run wrote that this one doesn't replace gets removed, and keys that are already right are
+        # left alone, so a re-run only changes what's different.
+        for target_sampler, record in zip(self.sampler.targets, records):
+            for channel in target_sampler.channels:
+                key_writer.add_previous_frames(channel.fcurve, record.get(history.channel_id(channel.fcurve), []))
+
+        self.number_of_keys_written = key_writer.write()
+        self.number_of_keys_unchanged = key_writer.number_of_keys_unchanged
+        self.number_of_keys_removed = key_writer.number_of_keys_removed
+        self.number_of_keys_decimated = key_writer.number_of_keys_decimated
+
+        for target_sampler in self.sampler.targets:
+            written_frames = {}
+            for channel in target_sampler.channels:
+                written_frames[channel.fcurve] = key_writer.written_frames[channel.fcurve]
+            history.save_record(target_sampler.obj, target_sampler.action, written_frames)
+
+        self.stats.count('fcurves_touched', key_writer.number_of_fcurves_changed)
+        self.stats.count('keys_written', self.number_of_keys_written)
+        self.stats.count('keys_unchanged', self.number_of_keys_unchanged)
+        self.stats.count('keys_removed', self.number_of_keys_removed)
+        self.stats.count('keys_decimated', self.number_of_keys_decimated)
+
+    def restore(self):
+        # Go back to the frame we started on; this also shows the new keys if that frame is in the destination range.
+        with self.stats.phase('restore frame'):
+            self.scene.frame_current = self.original_current_frame
+            self.view_layer.update()
+            self.stats.count('depsgraph_updates')
+
+    def finish(self):
+        self.restore()
+
+    def cancel(self):
+        # Nothing has been written yet, so all we need to do is put the frame back.
+        self.restore()
+
+    def run(self):
+        # Do the whole job in one go.
+        self.start()
+        while not self.step():
+            pass
+        self.finish()
@@ -0,0 +1,169 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+###############################################################################
+# What the last run wrote.
+#
+# Every run records, on each object it vibrated, which frames of which
+# F-curves hold keys it wrote. The next run on that object uses the record to
+# remove the old vibration's keys that the new one doesn't replace, and the
+# writer leaves alone any key that already has the right value, so changing
+# one setting only touches the keys that actually change. The record lives in
+# an ID property on the object, so it's saved with the .blend file. Each
+# channel is stored as a list entry holding its data path and array index,
+# rather than under a key named after the channel: ID property names can't
+# be longer than 63 characters, and bone names easily make a data path longer
+# than that.
+#
+# Most channels get keys on the same frames, so the record holds those frames
+# once, and each channel only lists the frames it differs on: the ones it has
+# no key of ours on (decimated away, or already right before we got there),
+# and any others. Frames are stored as runs of evenly spaced frames, which is
+# what the destination frames are, so a record's size doesn't grow with the
+# number of frames.
+#
+# Keys that were already there before we wrote over them with the same value
+# (a wall key on a frame the animator had keyed, say) are never recorded, so
+# we never remove anything that isn't ours.
+#
+# The keys at either end of the destination frames hold the animation's
+# values there from before any vibration was written. On a re-run, the
+# F-curve still has the last run's keys, so those values are worked out on a
+# copy of it without them (see UnrecordedValues).
+###############################################################################
+
+import bpy
+import numpy as np
+
+from . import cache
+
+# The name of the object's ID property that holds the record.
+RECORD_PROPERTY = 'good_vibrations_keys'
+
+# The action that UnrecordedValues makes its copies of F-curves in, while it needs them.
+SCRATCH_ACTION_NAME = 'Good Vibrations Scratch'
+
+# What gets copied for each key: everything that affects the F-curve's values (see cache), plus the handle types, so
+# update() recalculates the handles just as it would have without our keys.
+COPIED_KEYFRAME_ATTRIBUTES = cache.KEYFRAME_ATTRIBUTES + (('handle_left_type', 1, np.int32),
+                                                          ('handle_right_type', 1, np.int32))
+
+def channel_id(fcurve):
+    return (fcurve.data_path, fcurve.array_index)
+
+def frame_runs(frames):
+    # Frames as a flat list of (first frame, step, count) runs of evenly spaced frames.
+    frames = sorted(frames)
+    runs = []
+    i = 0
+    while i < len(frames):
+        count = 1
+        step = 1
+        if i + 1 < len(frames):
+            step = frames[i + 1] - frames[i]
+            while i + count < len(frames) and frames[i + count] - frames[i + count - 1] == step:
+                count += 1
+        runs += [frames[i], step, count]
+        i += count
+    return runs
+
+def run_frames(runs):
+    frames = []
+    for i in range(0, len(runs), 3):
+        first, step, count = runs[i:i + 3]
+        frames += range(first, first + step * count, step)
+    return frames
+
+def load_record(obj, action):
+    # The frames we wrote keys on last time, as {channel_id(): list of frames}. The record is ignored if it was for
+    # some other action than the one we're writing into now.
+    record = obj.get(RECORD_PROPERTY)
+    if record is None or record.get('action') != action.name:
+        return {}
+
+    common_frames = set(run_frames(list(record.get('frames', []))))
+    frames = {}
+    for channel in record.get('channels', []):
+        channel_frames = common_frames.difference(run_frames(list(channel.get('missing', []))))
+        channel_frames.update(run_frames(list(channel.get('extra', []))))
+        frames[(channel['data_path'], channel['array_index'])] = sorted(channel_frames)
+    return frames
+
+def save_record(obj, action, written_frames):
+    # written_frames is {fcurve: list of frames}, as left by writer.KeyframeWriter.write(). Channels that this run
+    # didn't write keep whatever was recorded for them.
+    channels = load_record(obj, action)
+    common_frames = set()
+    for fcurve, frames in written_frames.items():
+        frames = set(int(frame) for frame in frames)
+        common_frames.update(frames)
+        if len(frames) > 0:
+            channels[channel_id(fcurve)] = frames
+        else:
+            channels.pop(channel_id(fcurve), None)
+
+    records = []
+    for (data_path, array_index), frames in channels.items():
+        channel = {'data_path': data_path, 'array_index': array_index}
+        missing = common_frames.difference(frames)
+        if len(missing) > 0:
+            channel['missing'] = frame_runs(missing)
+        extra = set(frames).difference(common_frames)
+        if len(extra) > 0:
+            channel['extra'] = frame_runs(extra)
+        records.append(channel)
+
+    obj[RECORD_PROPERTY] = {'action': action.name, 'frames': frame_runs(common_frames), 'channels': records}
+
+class UnrecordedValues:
+    # Evaluates F-curves without the keys on the frames the last run recorded, which is what they evaluated to before
+    # that run (except where it wrote over one of the animator's keys; that key is gone for good). An F-curve that
+    # has any recorded keys is copied into a scratch action without them, and the copy is evaluated instead, so the
+    # F-curve itself isn't touched. Call remove() once done.
+    def __init__(self):
+        self.action = None
+
+    def evaluate(self, fcurve, frames, recorded_frames):
+        keyframe_points = fcurve.keyframe_points
+        count = len(keyframe_points)
+        co = np.empty(count * 2, dtype=np.float32)
+        keyframe_points.foreach_get('co', co)
+        keep = np.logical_not(np.isin(co[0::2], list(recorded_frames)))
+        if np.all(keep) or len(fcurve.modifiers) > 0:
+            # Either there's nothing to leave out, or there are modifiers, which we don't copy; that's the best we can do.
+            return [fcurve.evaluate(frame) for frame in frames]
+
+        if self.action is None:
+            self.action = bpy.data.actions.new(SCRATCH_ACTION_NAME)
+        copy = self.action.fcurves.new(fcurve.data_path, index=fcurve.array_index)
+        copy.extrapolation = fcurve.extrapolation
+        copy.keyframe_points.add(int(np.count_nonzero(keep)))
+        for name, size, dtype in COPIED_KEYFRAME_ATTRIBUTES:
+            values = np.empty(count * size, dtype=dtype)
+            keyframe_points.foreach_get(name, values)
+            copy.keyframe_points.foreach_set(name, values.reshape(count, size)[keep].reshape(-1))
+        copy.update()
+
+        values = [copy.evaluate(frame) for frame in frames]
+        self.action.fcurves.remove(copy)
+        return values
+
+    def remove(self):
+        if self.action is not None:
+            bpy.data.actions.remove(self.action)
+            self.action = None
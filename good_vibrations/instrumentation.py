@@ -0,0 +1,84 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+###############################################################################
+# Run statistics.
+#
+# Wall-clock time per phase of a job, plus a few counters, so we can see where
+# the time goes on a big shot and size jobs up before running them. Collecting
+# them is cheap (the phases are coarse), so every job does it; whether they
+# get reported is up to the caller. No bpy in here.
+###############################################################################
+
+import contextlib
+import json
+import time
+
+# The counters every run reports, in the order they're reported.
+COUNTERS = ('targets',
+            'channels',
+            'targets_from_cache',
+            'frames_evaluated',
+            'depsgraph_updates',
+            'fcurves_touched',
+            'keys_written',
+            'keys_unchanged',
+            'keys_removed',
+            'keys_decimated')
+
+class RunStats:
+    def __init__(self):
+        self.phase_seconds = {}  # {phase name: seconds}, in the order the phases first ran.
+        self.counters = {}
+        for name in COUNTERS:
+            self.counters[name] = 0
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        # Time a phase. Running the same phase more than once adds up the times.
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phase_seconds[name] = self.phase_seconds.get(name, 0.0) + (time.perf_counter() - start_time)
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def total_seconds(self):
+        return sum(self.phase_seconds.values())
+
+    def summary_lines(self):
+        # Human readable lines for the Info log.
+        lines = []
+        for name, seconds in self.phase_seconds.items():
+            lines.append('  ' + name + ': ' + format(seconds * 1000.0, '.1f') + ' ms')
+        lines.append('  total: ' + format(self.total_seconds() * 1000.0, '.1f') + ' ms')
+        for name, value in self.counters.items():
+            lines.append('  ' + name.replace('_', ' ') + ': ' + str(value))
+        return lines
+
+    def to_dict(self):
+        return {'phase_seconds': dict(self.phase_seconds),
+                'total_seconds': self.total_seconds(),
+                'counters': dict(self.counters)}
+
+def append_json_record(filepath, record):
+    # Records are appended one per line, so a file builds up a history of runs that's easy to compare.
+    with open(filepath, 'a') as f:
+        f.write(json.dumps(record) + '\n')
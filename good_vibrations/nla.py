@@ -0,0 +1,169 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+###############################################################################
+# NLA strip output.
+#
+# Instead of keying the vibration into the object's own action, we can build
+# it as an action of its own ("<object> Vibration") and play that from an NLA
+# strip over the destination frames. The source action isn't changed at all.
+#
+# The generated action only holds as much as it has to. If the vibration
+# repeats (say, two held poses switching back and forth), the action holds a
+# single cycle and the strip repeats it. Either way, the action has one key
+# per frame and the strip is scaled by the keyframe interval. The strip ends
+# on the last frame that Keyframes mode would show the vibration on. After
+# that, the source animation plays, just as the end wall key makes it do in
+# Keyframes mode.
+#
+# The active action always plays on top of the NLA stack, so it would hide
+# our strip. The first time we make a strip for an object, its action is
+# pushed down onto a track of its own (like the NLA editor's Push Down does),
+# below the vibration track. Going back to keying the action pulls it back
+# up (see pull_up_source()): a strip only plays the frame range the action
+# had when it was pushed down, so keys written outside of that would never
+# be seen.
+###############################################################################
+
+import math
+
+import bpy
+import numpy as np
+
+from . import sampling
+from . import writer
+
+# How close two samples have to be for the vibration to count as repeating.
+PERIOD_TOLERANCE = 1e-6
+
+# The most repeats an NLA strip can have.
+MAX_REPEAT = 1000
+
+def find_period(samples):
+    # The smallest number of rows after which the samples (an array of shape (rows, channels)) repeat, or the
+    # number of rows if they don't. It has to repeat at least once to count.
+    number_of_rows = len(samples)
+    for period in range(1, number_of_rows // 2 + 1):
+        if not np.allclose(samples[period], samples[0], rtol=0.0, atol=PERIOD_TOLERANCE):
+            continue  # Quick check before comparing everything.
+        if np.allclose(samples[period:], samples[:-period], rtol=0.0, atol=PERIOD_TOLERANCE):
+            return period
+    return number_of_rows
+
+def find_track(anim_data, name):
+    for track in anim_data.nla_tracks:
+        if track.name == name:
+            return track
+    return None
+
+def push_down_source(anim_data):
+    # Move the active action onto our source track, so it plays underneath the vibration track.
+    action = anim_data.action
+    if action is None:
+        return
+
+    track = sampling.source_track(anim_data)
+    if track is None:
+        track = anim_data.nla_tracks.new()
+        track.name = sampling.SOURCE_TRACK_NAME
+    for strip in list(track.strips):
+        track.strips.remove(strip)
+
+    frame_start, frame_end = action.frame_range
+    strip = track.strips.new(action.name, int(frame_start), action)
+    strip.extrapolation = 'HOLD'
+    anim_data.action = None
+
+def pull_up_source(anim_data):
+    # Undo push_down_source(): make the action on our source track the active action again, and remove the track.
+    track = sampling.source_track(anim_data)
+    if track is None or anim_data.action is not None:
+        return  # Nothing was pushed down, or the animator has made some other action active since.
+
+    if len(track.strips) > 0:
+        anim_data.action = track.strips[0].action
+    anim_data.nla_tracks.remove(track)
+
+def mute_vibration_track(anim_data):
+    # When keying into the action again, the strip from an earlier run mustn't hide the new keys.
+    track = find_track(anim_data, sampling.VIBRATION_TRACK_NAME)
+    if track is not None:
+        track.mute = True
+
+def vibration_action(obj):
+    # The action that holds the object's vibration, emptied out.
+    name = obj.name + ' Vibration'
+    action = bpy.data.actions.get(name)
+    if action is None:
+        action = bpy.data.actions.new(name)
+        action.id_root = 'OBJECT'
+    for fcurve in list(action.fcurves):
+        action.fcurves.remove(fcurve)
+    return action
+
+def write_strip(obj, channels, samples, schedule, create_keyframe_frame_interval, decimate_tolerance=None):
+    # Write the vibration for one target (samples has a column per channel, a row per row of the schedule) into
+    # its vibration action, and play that from a strip over the destination frames. Returns the number of keys
+    # written and the number that were decimated (see writer.KeyframeWriter).
+    anim_data = obj.animation_data
+    push_down_source(anim_data)
+
+    # A strip's end frame is part of the strip. If there's a key on the last destination frame, the strip ends
+    # there; if not, the end wall key would put the source animation back on that frame, so the strip ends on the
+    # frame before it (or half way to it, since a strip can't be zero frames long).
+    if (schedule.dest_frame_end - schedule.dest_frame_start) % create_keyframe_frame_interval == 0:
+        frame_end = schedule.dest_frame_end
+    elif schedule.dest_frame_end - 1 > schedule.dest_frame_start:
+        frame_end = schedule.dest_frame_end - 1
+    else:
+        frame_end = schedule.dest_frame_end - 0.5
+    strip_length = frame_end - schedule.dest_frame_start
+
+    period = find_period(samples)
+    if strip_length / (period * create_keyframe_frame_interval) > MAX_REPEAT:
+        # Put as many cycles in the action as it takes to keep the repeats down.
+        period *= math.ceil(strip_length / (period * create_keyframe_frame_interval * MAX_REPEAT))
+
+    # Blender plays the action's end frame (rather than its start) when the strip ends right where a cycle would
+    # start again, so there's a key there that starts the cycle again. Anywhere else, it's never played.
+    key_frames = list(range(period + 1))
+    rows = list(range(period)) + [0]
+
+    action = vibration_action(obj)
+    key_writer = writer.KeyframeWriter(decimate_tolerance=decimate_tolerance)
+    for i, channel in enumerate(channels):
+        fcurve = action.fcurves.new(channel.data_path, index=channel.array_index)
+        key_writer.add_keys(fcurve, key_frames, samples[rows, i], 'CONSTANT', decimate=True)
+    number_of_keys_written = key_writer.write()
+
+    # A fresh track goes on top of the stack, above the source track.
+    track = find_track(anim_data, sampling.VIBRATION_TRACK_NAME)
+    if track is not None:
+        anim_data.nla_tracks.remove(track)
+    track = anim_data.nla_tracks.new()
+    track.name = sampling.VIBRATION_TRACK_NAME
+
+    strip = track.strips.new(action.name, schedule.dest_frame_start, action)
+    strip.blend_type = 'REPLACE'
+    strip.extrapolation = 'NOTHING'
+    strip.action_frame_start = 0
+    strip.action_frame_end = period
+    strip.scale = create_keyframe_frame_interval
+    strip.repeat = strip_length / (period * create_keyframe_frame_interval)
+
+    return (number_of_keys_written, key_writer.number_of_keys_decimated)
@@ -0,0 +1,79 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+###############################################################################
+# Vibration schedule planner.
+#
+# Works out which source frame feeds each destination frame: we pull keys from
+# Vibration #1 for vib_stay_on frames, then from Vibration #2 for vib_stay_on
+# frames, and so on, writing a key every create_keyframe_frame_interval frames.
+# The whole schedule is computed in one go with NumPy, and nothing in here
+# touches bpy.
+###############################################################################
+
+import numpy as np
+
+from . import ranges
+
+# Values of VibrationSchedule.source_ids.
+VIB1 = 0
+VIB2 = 1
+
+class VibrationSchedule:
+    # Three parallel arrays, one entry per key we're going to write:
+    #   dest_frames   - the frame the key is written on
+    #   source_frames - the frame the key's pose is read from
+    #   source_ids    - VIB1 or VIB2, depending on which vibration that source frame belongs to
+    def __init__(self, dest_frames, source_frames, source_ids, dest_frame_start, dest_frame_end):
+        self.dest_frames = dest_frames
+        self.source_frames = source_frames
+        self.source_ids = source_ids
+        self.dest_frame_start = dest_frame_start  # The destination range is walled off on these two frames.
+        self.dest_frame_end = dest_frame_end
+
+    def __len__(self):
+        return len(self.dest_frames)
+
+def plan_schedule(vib1_frame_start, vib1_frame_end, vib2_frame_start, dest_frame_start, vib_stay_on, create_keyframe_frame_interval):
+    # Raises a ValueError if the parameters don't describe a vibration we can create.
+    vib1_frame_start, vib1_frame_end = ranges.vib1_frame_range(vib1_frame_start, vib1_frame_end)
+
+    if vib1_frame_start == vib1_frame_end:
+        raise ValueError('Vibration #1 Start Frame and End Frame cannot be the same frame.')
+
+    if create_keyframe_frame_interval < 1:
+        raise ValueError('Create Keyframe Frame Interval must be at least 1.')
+
+    vib_stay_on = max(vib_stay_on, 1)  # Anything less than 1 switches vibrations on every frame, same as 1.
+
+    offsets = np.arange(0, vib1_frame_end - vib1_frame_start + 1, create_keyframe_frame_interval, dtype=np.int64)
+    source_ids = (offsets // vib_stay_on) % 2
+    source_frames = np.where(source_ids == VIB1, vib1_frame_start, vib2_frame_start) + offsets
+    dest_frames = dest_frame_start + offsets
+
+    return VibrationSchedule(dest_frames, source_frames, source_ids,
+                             dest_frame_start, dest_frame_start + (vib1_frame_end - vib1_frame_start))
+
+def plan_schedule_from_settings(settings):
+    # Same as plan_schedule(), but from a state.VibrationSettings.
+    return plan_schedule(settings.vib1_frame_start,
+                         settings.vib1_frame_end,
+                         settings.vib2_frame_start,
+                         settings.dest_frame_start,
+                         settings.vib_stay_on,
+                         settings.create_keyframe_frame_interval)
@@ -0,0 +1,66 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+###############################################################################
+# Array-backed pose snapshots.
+#
+# A pose is held as one flat float32 array per transform property, covering
+# every pose bone in order, and is read and written with foreach_get() and
+# foreach_set() instead of copying Vectors/Quaternions bone by bone.
+###############################################################################
+
+import numpy as np
+
+# {pose bone transform property: number of floats per bone}
+POSE_PROPS = {'location': 3,
+              'rotation_euler': 3,
+              'rotation_quaternion': 4,
+              'rotation_axis_angle': 4,
+              'scale': 3}
+
+def bone_mask(pose_bones, bone_name):
+    # A boolean array with one entry per pose bone, True for the bones we want to vibrate
+    # (all of them if bone_name is empty).
+    if bone_name == None or bone_name == '':
+        return np.ones(len(pose_bones), dtype=bool)
+
+    names = np.array([bone.name for bone in pose_bones], dtype=object)
+    return names == bone_name
+
+def value_index(prop, bone_index, array_index):
+    # Where a single channel's value lives in a snapshot's array for prop.
+    return bone_index * POSE_PROPS[prop] + array_index
+
+class PoseSnapshot:
+    def __init__(self, number_of_bones, props=('location', 'rotation_euler', 'rotation_quaternion', 'scale')):
+        # The arrays are allocated once and refilled on every capture().
+        self.number_of_bones = number_of_bones
+        self.arrays = {}
+        for prop in props:
+            self.arrays[prop] = np.zeros(number_of_bones * POSE_PROPS[prop], dtype=np.float32)
+
+    def capture(self, pose_bones):
+        for prop, array in self.arrays.items():
+            pose_bones.foreach_get(prop, array)
+
+    def set_values(self, pose_bones, prop, value_indices, values):
+        # Change just some of the values of prop (see value_index()), leaving everything else as it is.
+        array = self.arrays[prop]
+        pose_bones.foreach_get(prop, array)
+        array[value_indices] = values
+        pose_bones.foreach_set(prop, array)
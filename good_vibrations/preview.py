@@ -0,0 +1,115 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+###############################################################################
+# Live preview.
+#
+# A preview samples the source frames just like Create Keyframes does, but
+# instead of writing any keys, it keeps the samples and poses the targets
+# from them whenever the current frame is in the destination range (see
+# apply(), which the add-on calls from a frame_change_post handler). Every
+# destination frame is mapped to its row of samples up front, so showing a
+# frame is one lookup plus one foreach_get()/foreach_set() per transform
+# property. Committing the preview writes the samples it already has.
+###############################################################################
+
+import numpy as np
+
+from . import engine
+from . import pose
+
+class PreviewTarget:
+    # Poses one target from its row of samples.
+    def __init__(self, target_sampler):
+        self.obj = target_sampler.obj
+        self.samples = target_sampler.samples
+
+        self.object_channels = []  # [(sample column, data path, array index), ...]
+        self.bone_channels = {}  # {prop: ([sample column, ...], [index into the snapshot array, ...])}
+        for i, channel in enumerate(target_sampler.channels):
+            if channel.bone_index is None:
+                self.object_channels.append((i, channel.data_path, channel.array_index))
+            else:
+                if channel.prop not in self.bone_channels:
+                    self.bone_channels[channel.prop] = ([], [])
+                self.bone_channels[channel.prop][0].append(i)
+                self.bone_channels[channel.prop][1].append(pose.value_index(channel.prop, channel.bone_index, channel.array_index))
+
+        self.snapshot = None
+        if len(self.bone_channels) > 0:
+            self.snapshot = pose.PoseSnapshot(len(self.obj.pose.bones), self.bone_channels.keys())
+
+    def apply(self, row):
+        values = self.samples[row]
+        for prop, (columns, value_indices) in self.bone_channels.items():
+            self.snapshot.set_values(self.obj.pose.bones, prop, value_indices, values[columns])
+        for i, data_path, array_index in self.object_channels:
+            self.obj.path_resolve(data_path, False)[array_index] = values[i]
+        self.obj.update_tag()
+
+class Preview:
+    def __init__(self, context, settings):
+        # Samples everything up front; raises an engine.VibrationError if there's nothing to preview.
+        self.job = engine.VibrationJob(context, settings)
+        self.job.start()
+        self.job.sample()
+
+        # {destination frame - dest_frame_start: row of samples}. Keys are CONSTANT, so each frame shows the row of the
+        # last key on or before it.
+        schedule = self.job.schedule
+        self.frame_start = schedule.dest_frame_start
+        self.frame_end = schedule.dest_frame_end
+        frames = np.arange(self.frame_start, self.frame_end + 1)
+        self.rows = (np.searchsorted(schedule.dest_frames, frames, side='right') - 1).tolist()
+
+        self.targets = [PreviewTarget(target_sampler) for target_sampler in self.job.sampler.targets]
+
+    def apply(self, frame):
+        # Show the vibration on frame, if it's one of the destination frames.
+        frame = int(frame)
+        if frame < self.frame_start or frame > self.frame_end:
+            return
+        row = self.rows[frame - self.frame_start]
+        for target in self.targets:
+            target.apply(row)
+
+    def commit(self):
+        # Write the keys, just as Create Keyframes would have.
+        self.job.original_current_frame = self.job.scene.frame_current
+        self.job.write()
+        self.job.finish()
+
+# The preview that's showing, if there is one.
+active_preview = None
+
+def start(context, settings):
+    # Raises an engine.VibrationError if there's nothing to preview.
+    global active_preview
+    active_preview = None
+    active_preview = Preview(context, settings)
+    active_preview.apply(context.scene.frame_current)
+
+def stop(scene=None):
+    # Stop previewing. If there's a scene, re-evaluate it so the targets go back to their animated poses.
+    global active_preview
+    active_preview = None
+    if scene is not None:
+        scene.frame_set(scene.frame_current)
+
+def is_active():
+    return active_preview is not None
@@ -0,0 +1,63 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+###############################################################################
+# Frame range math.
+#
+# Everything here works on plain integers (no bpy), so it's cheap enough to
+# run on every panel redraw and easy to check outside of Blender. All ranges
+# are inclusive (start, end) tuples.
+###############################################################################
+
+from collections import namedtuple
+
+# One source range that the destination frames run into.
+FrameRangeConflict = namedtuple('FrameRangeConflict', ['range_name', 'frame_start', 'frame_end', 'number_of_frames'])
+
+def vib1_frame_range(vib1_frame_start, vib1_frame_end):
+    # The start and end frames of Vibration #1 can be entered in either order.
+    if vib1_frame_end < vib1_frame_start:
+        return (vib1_frame_end, vib1_frame_start)
+    return (vib1_frame_start, vib1_frame_end)
+
+def offset_frame_range(frame_range, frame_start):
+    # A range that's as long as frame_range, but starts at frame_start.
+    return (frame_start, frame_start + (frame_range[1] - frame_range[0]))
+
+def overlapping_frames(range_a, range_b):
+    # The (start, end) frames that both ranges share, or None if they don't overlap.
+    frame_start = max(range_a[0], range_b[0])
+    frame_end = min(range_a[1], range_b[1])
+    if frame_start > frame_end:
+        return None
+    return (frame_start, frame_end)
+
+def frame_range_conflicts(vib1_frame_start, vib1_frame_end, vib2_frame_start, dest_frame_start):
+    # Returns a list of FrameRangeConflicts, one for each source range that the destination frames overlap.
+    # An empty list means we're good to go.
+    vib1_range = vib1_frame_range(vib1_frame_start, vib1_frame_end)
+    vib2_range = offset_frame_range(vib1_range, vib2_frame_start)
+    dest_range = offset_frame_range(vib1_range, dest_frame_start)
+
+    conflicts = []
+    for range_name, source_range in (('Vibration #1', vib1_range), ('Vibration #2', vib2_range)):
+        overlap = overlapping_frames(dest_range, source_range)
+        if overlap is not None:
+            conflicts.append(FrameRangeConflict(range_name, overlap[0], overlap[1], overlap[1] - overlap[0] + 1))
+
+    return conflicts
@@ -0,0 +1,287 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+###############################################################################
+# Source pose sampling.
+#
+# Reads the Vibration #1/#2 source poses straight out of the action's F-curves,
+# so we never have to scrub the timeline and re-evaluate the whole scene just
+# to find out what a channel's value is on a given frame. Channels whose value
+# can't be read from the action alone (driven channels, muted F-curves, or
+# objects that have an NLA stack or action blending in play) fall back to the
+# old behavior of setting the frame and updating the view layer.
+###############################################################################
+
+import numpy as np
+
+from . import cache
+from . import pose
+
+def transform_props(location, rotation, scale):
+    # Which transform properties should be vibrated, given the Location/Rotation/Scale checkboxes. 'rotation' stands
+    # for whichever rotation property is actually in use (see rotation_prop()).
+    props = []
+    if location:
+        props.append('location')
+    if rotation:
+        props.append('rotation')
+    if scale:
+        props.append('scale')
+    return props
+
+def rotation_prop(rotation_mode):
+    # The rotation property that an object or pose bone with this rotation mode is actually using.
+    if rotation_mode == 'QUATERNION':
+        return 'rotation_quaternion'
+    if rotation_mode == 'AXIS_ANGLE':
+        return 'rotation_axis_angle'
+    return 'rotation_euler'
+
+def target_data_paths(obj, bone_name, object_props, bone_props):
+    # All of the data paths (relative to the object) that we want to vibrate, as a dictionary of
+    # {data_path: (index of the pose bone or None for the object itself, transform property)}.
+    data_paths = {}
+    for prop in object_props:
+        if prop == 'rotation':
+            prop = rotation_prop(obj.rotation_mode)
+        data_paths[prop] = (None, prop)
+
+    if obj.type == 'ARMATURE':
+        pose_bones = obj.pose.bones
+        for bone_index in np.flatnonzero(pose.bone_mask(pose_bones, bone_name)).tolist():
+            bone = pose_bones[bone_index]
+            for prop in bone_props:
+                if prop == 'rotation':
+                    prop = rotation_prop(bone.rotation_mode)
+                data_paths[bone.path_from_id(prop)] = (bone_index, prop)
+
+    return data_paths
+
+# The NLA tracks we make when writing the vibration as an NLA strip (see nla.py): one for the source action, once
+# it's been pushed down out of the active action, and one for the vibration itself.
+SOURCE_TRACK_NAME = 'Good Vibrations Source'
+VIBRATION_TRACK_NAME = 'Good Vibrations'
+
+def source_track(anim_data):
+    for track in anim_data.nla_tracks:
+        if track.name == SOURCE_TRACK_NAME:
+            return track
+    return None
+
+def source_action(anim_data):
+    # The action the vibration is made from: the active action or, if we've pushed that down onto our source
+    # track, the action on that track. None if there isn't one.
+    if anim_data is None:
+        return None
+    if anim_data.action is not None:
+        return anim_data.action
+
+    track = source_track(anim_data)
+    if track is not None and len(track.strips) > 0:
+        return track.strips[0].action
+    return None
+
+def is_action_evaluated_directly(anim_data):
+    # If there's an NLA stack or the action is blended in some way, what we see in the scene isn't simply
+    # what the action's F-curves say, so we can't sample the F-curves directly. Our own tracks don't count: the
+    # source track plays the source action as is, and the vibration track never covers the source frames.
+    if anim_data.action_blend_type != 'REPLACE' or anim_data.action_influence < 1.0:
+        return False
+
+    if anim_data.use_nla:
+        for track in anim_data.nla_tracks:
+            if track.name in (SOURCE_TRACK_NAME, VIBRATION_TRACK_NAME):
+                continue
+            if not track.mute and len(track.strips) > 0:
+                return False
+
+    return True
+
+class Channel:
+    # One animated channel (an F-curve) that we're going to vibrate.
+    def __init__(self, fcurve, bone_index, prop, needs_scrub):
+        self.fcurve = fcurve
+        self.data_path = fcurve.data_path
+        self.array_index = fcurve.array_index
+        self.bone_index = bone_index  # Index into obj.pose.bones, or None if this is one of the object's channels.
+        self.prop = prop
+        self.needs_scrub = needs_scrub  # True if we have to evaluate the scene to find this channel's value.
+
+def find_channels(obj, data_paths):
+    # Find the F-curves in the object's action that match the data paths we want to vibrate
+    # (as returned by target_data_paths()).
+    anim_data = obj.animation_data
+    action = source_action(anim_data)
+    if action is None:
+        return []
+
+    action_evaluated_directly = is_action_evaluated_directly(anim_data)
+
+    channels = []
+    for fcurve in action.fcurves:
+        target = data_paths.get(fcurve.data_path)
+        if target is None:
+            continue
+
+        driven = anim_data.drivers.find(fcurve.data_path, index=fcurve.array_index) is not None
+        needs_scrub = driven or fcurve.mute or not action_evaluated_directly
+        channels.append(Channel(fcurve, target[0], target[1], needs_scrub))
+
+    return channels
+
+class TargetSampler:
+    # Works out how to sample each of one object's channels (see SourceSampler), and holds the samples.
+    def __init__(self, obj, channels, number_of_frames):
+        self.obj = obj
+        self.action = source_action(obj.animation_data)
+        self.channels = channels
+        self.samples = np.zeros((number_of_frames, len(channels)), dtype=np.float64)
+        self.rows_to_sample = np.ones(number_of_frames, dtype=bool)  # Fewer, if some of the samples are cached.
+
+        self.fcurve_columns = []
+        self.fcurve_evaluators = []
+        self.object_channels = []
+        self.bone_channels = {}  # {prop: ([sample column, ...], [index into the snapshot array, ...])}
+        for i, channel in enumerate(channels):
+            if not channel.needs_scrub:
+                self.fcurve_columns.append(i)
+                self.fcurve_evaluators.append(channel.fcurve.evaluate)
+            elif channel.bone_index is None:
+                # The object's own channels are read directly.
+                self.object_channels.append(i)
+            else:
+                # Bone channels are read out of a pose snapshot that's captured once per frame.
+                if channel.prop not in self.bone_channels:
+                    self.bone_channels[channel.prop] = ([], [])
+                self.bone_channels[channel.prop][0].append(i)
+                self.bone_channels[channel.prop][1].append(pose.value_index(channel.prop, channel.bone_index, channel.array_index))
+
+        self.needs_scrub = len(self.object_channels) > 0 or len(self.bone_channels) > 0
+
+        self.snapshot = None
+        if len(self.bone_channels) > 0:
+            self.snapshot = pose.PoseSnapshot(len(obj.pose.bones), self.bone_channels.keys())
+
+    def sample_fcurves(self, row, frame):
+        if len(self.fcurve_columns) > 0:
+            self.samples[row, self.fcurve_columns] = [evaluate(frame) for evaluate in self.fcurve_evaluators]
+
+    def sample_scene(self, row):
+        # The scene has to have been evaluated on the frame we're sampling.
+        if self.snapshot is not None:
+            self.snapshot.capture(self.obj.pose.bones)
+            for prop, (columns, value_indices) in self.bone_channels.items():
+                self.samples[row, columns] = self.snapshot.arrays[prop][value_indices]
+
+        for i in self.object_channels:
+            self.samples[row, i] = self.obj.path_resolve(self.channels[i].data_path, False)[self.channels[i].array_index]
+
+class SourceSampler:
+    # Fills in an array of shape (len(frames), len(channels)) for each target, with the value of every one of the
+    # target's channels on every frame. This is done one frame (row) at a time, so that long jobs can be split up
+    # into chunks.
+    # Channels that can be read from their F-curves never touch the scene. Only if there's at least one channel
+    # that needs scrubbing do we step through the frames and re-evaluate the view layer, and then only once per
+    # frame for all of those channels of all of the targets together. Scrubbing changes the current frame; it's up
+    # to the caller to put it back.
+    # If there's a pose_cache (a cache.SourcePoseCache), only the rows of each target that aren't in it are
+    # sampled, and rows_to_sample only holds the rows that some target needs. Call cache_samples() once they've all
+    # been sampled to add them to the cache.
+    def __init__(self, scene, view_layer, targets, frames, stats, pose_cache=None, source_ranges=()):
+        # targets is a list of (object, list of Channels). Timings and counts go into stats (an
+        # instrumentation.RunStats). source_ranges are the inclusive (start, end) ranges that frames come from.
+        self.scene = scene
+        self.view_layer = view_layer
+        self.stats = stats
+        self.pose_cache = pose_cache
+        self.source_ranges = list(source_ranges)
+        self.frames = np.asarray(frames).tolist()
+        self.targets = []
+        self.cache_keys = []  # (cache key, fingerprint) for each target, or None if it can't be cached.
+        self.targets_to_sample = []
+        self.samples_cached = False  # See cache_samples().
+        for obj, channels in targets:
+            target = TargetSampler(obj, channels, len(self.frames))
+            self.targets.append(target)
+            self.cache_keys.append(self.find_in_cache(target))
+        self.needs_scrub = any(target.needs_scrub for target in self.targets_to_sample)
+
+        # The rows that at least one target still needs, in order.
+        self.rows_to_sample = []
+        if len(self.targets_to_sample) > 0:
+            self.rows_to_sample = np.flatnonzero(np.any([target.rows_to_sample for target in self.targets_to_sample], axis=0)).tolist()
+
+    def find_in_cache(self, target):
+        # Fills in whichever of the target's samples are cached. Returns the target's (cache key, fingerprint).
+        if self.pose_cache is None:
+            self.targets_to_sample.append(target)
+            return None
+
+        fingerprint = cache.channels_fingerprint(target.channels, self.source_ranges)
+        if fingerprint is None:
+            self.targets_to_sample.append(target)
+            return None
+
+        key = cache.cache_key(target.obj, target.action, target.channels, self.source_ranges)
+        cached = self.pose_cache.get(key, fingerprint, self.frames)
+        if cached is None:
+            self.targets_to_sample.append(target)
+            return (key, fingerprint)
+
+        samples, found = cached
+        target.samples[found] = samples[found]
+        target.rows_to_sample = np.logical_not(found)
+        if np.any(target.rows_to_sample):
+            self.targets_to_sample.append(target)
+        else:
+            self.stats.count('targets_from_cache')
+        return (key, fingerprint)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def needs_sampling(self):
+        return len(self.rows_to_sample) > 0
+
+    def sample(self, row):
+        frame = self.frames[row]
+
+        with self.stats.phase('sample F-curves'):
+            for target in self.targets_to_sample:
+                if target.rows_to_sample[row]:
+                    target.sample_fcurves(row, frame)
+
+        if self.needs_scrub:
+            with self.stats.phase('scrub scene'):
+                self.scene.frame_current = frame
+                self.view_layer.update()
+                self.stats.count('depsgraph_updates')
+                for target in self.targets_to_sample:
+                    if target.needs_scrub and target.rows_to_sample[row]:
+                        target.sample_scene(row)
+
+        self.stats.count('frames_evaluated')
+
+    def cache_samples(self):
+        # Remember the samples of every target we sampled that can be cached. Only the first call does anything.
+        if self.pose_cache is None or self.samples_cached:
+            return
+        self.samples_cached = True
+        for target, cache_key in zip(self.targets, self.cache_keys):
+            if cache_key is not None and target in self.targets_to_sample:
+                self.pose_cache.put(cache_key[0], cache_key[1], self.frames, target.samples)
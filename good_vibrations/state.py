@@ -0,0 +1,181 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+###############################################################################
+# Vibration settings and the state the panel and operators work from.
+#
+# Nothing in here touches bpy. The add-on resolves the preferences and the
+# target object once, builds a VibrationState out of plain values, and keeps
+# it around until something it depends on changes.
+###############################################################################
+
+from . import ranges
+
+def check_names(values, names):
+    # Make sure a dictionary of settings doesn't contain anything that isn't in names.
+    for name in values:
+        if name not in names:
+            raise ValueError("Unknown setting '" + name + "'.")
+    return values
+
+class VibrationTarget:
+    # An object (and optionally one of its bones) to vibrate, and which of its transforms to vibrate.
+    names = ('vibration_object',
+             'vibration_object_location',
+             'vibration_object_rotation',
+             'vibration_object_scale',
+             'vibration_bone',
+             'vibration_bone_location',
+             'vibration_bone_rotation',
+             'vibration_bone_scale')
+
+    def __init__(self,
+                 vibration_object='',
+                 vibration_object_location=True,
+                 vibration_object_rotation=True,
+                 vibration_object_scale=True,
+                 vibration_bone='',
+                 vibration_bone_location=True,
+                 vibration_bone_rotation=True,
+                 vibration_bone_scale=True):
+        self.vibration_object = vibration_object
+        self.vibration_object_location = vibration_object_location
+        self.vibration_object_rotation = vibration_object_rotation
+        self.vibration_object_scale = vibration_object_scale
+        self.vibration_bone = vibration_bone
+        self.vibration_bone_location = vibration_bone_location
+        self.vibration_bone_rotation = vibration_bone_rotation
+        self.vibration_bone_scale = vibration_bone_scale
+
+    @classmethod
+    def from_properties(cls, properties):
+        # Works with the add-on preferences, one of its extra targets, or anything else with the same attributes.
+        values = {}
+        for name in cls.names:
+            values[name] = getattr(properties, name)
+        return cls(**values)
+
+class VibrationSettings:
+    # A plain copy of everything in the preferences that describes a vibration.
+    names = VibrationTarget.names + ('vib1_frame_start',
+                                     'vib1_frame_end',
+                                     'vib2_frame_start',
+                                     'vib_stay_on',
+                                     'dest_frame_start',
+                                     'create_keyframe_frame_interval',
+                                     'output_mode',
+                                     'decimate_keys',
+                                     'decimate_tolerance')
+
+    def __init__(self,
+                 vibration_object='',
+                 vibration_object_location=True,
+                 vibration_object_rotation=True,
+                 vibration_object_scale=True,
+                 vibration_bone='',
+                 vibration_bone_location=True,
+                 vibration_bone_rotation=True,
+                 vibration_bone_scale=True,
+                 vib1_frame_start=301,
+                 vib1_frame_end=400,
+                 vib2_frame_start=401,
+                 vib_stay_on=1,
+                 dest_frame_start=101,
+                 create_keyframe_frame_interval=1,
+                 output_mode='KEYS',
+                 decimate_keys=False,
+                 decimate_tolerance=0.0001,
+                 extra_targets=None):
+        self.vibration_object = vibration_object
+        self.vibration_object_location = vibration_object_location
+        self.vibration_object_rotation = vibration_object_rotation
+        self.vibration_object_scale = vibration_object_scale
+        self.vibration_bone = vibration_bone
+        self.vibration_bone_location = vibration_bone_location
+        self.vibration_bone_rotation = vibration_bone_rotation
+        self.vibration_bone_scale = vibration_bone_scale
+        self.vib1_frame_start = vib1_frame_start
+        self.vib1_frame_end = vib1_frame_end
+        self.vib2_frame_start = vib2_frame_start
+        self.vib_stay_on = vib_stay_on
+        self.dest_frame_start = dest_frame_start
+        self.create_keyframe_frame_interval = create_keyframe_frame_interval
+        self.output_mode = output_mode  # 'KEYS' to key the objects' own actions, 'NLA' for a generated action on an NLA strip.
+        self.decimate_keys = decimate_keys  # Leave out keys that hold the same value as the key before them.
+        self.decimate_tolerance = decimate_tolerance
+        if extra_targets is None:
+            extra_targets = []
+        self.extra_targets = extra_targets  # VibrationTargets vibrated along with the main one, over the same frames.
+
+    @classmethod
+    def from_preferences(cls, preferences):
+        # Works with the add-on preferences, or anything else that has the same attributes.
+        values = {}
+        for name in cls.names:
+            values[name] = getattr(preferences, name)
+
+        values['extra_targets'] = []
+        for extra_target in getattr(preferences, 'extra_targets', []):
+            values['extra_targets'].append(VibrationTarget.from_properties(extra_target))
+
+        return cls(**values)
+
+    @classmethod
+    def from_dict(cls, values):
+        # Build the settings from a dictionary that uses the same names as the preferences (say, from a JSON job
+        # file). extra_targets, if there are any, is a list of dictionaries using VibrationTarget's names.
+        # Raises a ValueError for anything we don't recognize.
+        values = dict(values)
+        extra_targets = []
+        for extra_target in values.pop('extra_targets', []):
+            extra_targets.append(VibrationTarget(**check_names(extra_target, VibrationTarget.names)))
+        values = check_names(values, cls.names)
+        values['extra_targets'] = extra_targets
+        return cls(**values)
+
+    def targets(self):
+        # The main target (from these settings) followed by any extra targets.
+        return [VibrationTarget.from_properties(self)] + self.extra_targets
+
+class VibrationState:
+    # Everything the panel and the operators need to know, computed once.
+    # object_types is a dictionary of {object name: object type} for the objects of every target that exist.
+    def __init__(self, settings, object_types):
+        self.settings = settings
+        self.object_types = object_types
+        self.object_name = settings.vibration_object
+        self.object_type = object_types.get(self.object_name)
+        self.object_exists = self.object_type is not None
+        self.is_armature = self.object_type == 'ARMATURE'
+
+        # Every extra target needs an object, too.
+        self.extra_targets_exist = True
+        for extra_target in settings.extra_targets:
+            if extra_target.vibration_object not in object_types:
+                self.extra_targets_exist = False
+
+        self.vib1_range = ranges.vib1_frame_range(settings.vib1_frame_start, settings.vib1_frame_end)
+        self.total_number_of_frames = self.vib1_range[1] - self.vib1_range[0]
+        self.vib2_range = ranges.offset_frame_range(self.vib1_range, settings.vib2_frame_start)
+        self.dest_range = ranges.offset_frame_range(self.vib1_range, settings.dest_frame_start)
+        self.conflicts = ranges.frame_range_conflicts(settings.vib1_frame_start, settings.vib1_frame_end,
+                                                      settings.vib2_frame_start, settings.dest_frame_start)
+        self.do_frame_ranges_conflict = len(self.conflicts) > 0
+
+        # Can we hit the Create Keyframes button?
+        self.is_valid = (not self.do_frame_ranges_conflict) and self.object_name != '' and self.object_exists and self.extra_targets_exist
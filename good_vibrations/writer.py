@@ -0,0 +1,235 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+###############################################################################
+# Bulk keyframe writer.
+#
+# Instead of inserting keys one at a time through the keying operators (which
+# depend on the context, key every animated channel and are slow to dispatch),
+# we collect every (frame, value) pair per F-curve first, then write them all
+# with a single keyframe_points.add() and a handful of foreach_set() calls, and
+# finish each F-curve with a single update().
+###############################################################################
+
+import bpy
+import numpy as np
+
+interpolation_values = {}  # {interpolation name: enum value}, filled in as we need them.
+
+def interpolation_value(interpolation):
+    # foreach_get()/foreach_set() deal with enums as plain integers.
+    if interpolation not in interpolation_values:
+        interpolation_values[interpolation] = bpy.types.Keyframe.bl_rna.properties['interpolation'].enum_items[interpolation].value
+    return interpolation_values[interpolation]
+
+class KeyframeWriter:
+    def __init__(self, default_interpolation='BEZIER', decimate_tolerance=None):
+        self.default_interpolation = default_interpolation  # Interpolation for new keys that don't ask for one.
+        self.decimate_tolerance = decimate_tolerance  # If this isn't None, redundant keys are dropped; see add_keys().
+        self.keys = {}  # {fcurve: {frame: (value, interpolation)}}
+        self.previous_frames = {}  # {fcurve: set of frames}; see add_previous_frames().
+        self.decimate_frames = {}  # {fcurve: set of frames}; see add_keys().
+
+        # Filled in by write().
+        self.written_frames = {}  # {fcurve: sorted list of the frames we now own}; see write().
+        self.number_of_keys_unchanged = 0
+        self.number_of_keys_removed = 0
+        self.number_of_keys_decimated = 0
+        self.number_of_fcurves_changed = 0
+
+    def add(self, fcurve, frame, value, interpolation=None):
+        # interpolation=None keeps the interpolation of a keyframe that's already on that frame.
+        # Adding a key on a frame that already has a pending key replaces the pending key.
+        if fcurve not in self.keys:
+            self.keys[fcurve] = {}
+        self.keys[fcurve][frame] = (value, interpolation)
+
+    def add_keys(self, fcurve, frames, values, interpolation=None, decimate=False):
+        # Same as add(), for a whole sequence (or array) of frames and values at once.
+        # With decimate=True (and a decimate_tolerance), any of these keys that wouldn't change the curve are dropped
+        # when we write: see decimate_keys().
+        frames = np.asarray(frames).tolist()
+        for frame, value in zip(frames, np.asarray(values).tolist()):
+            self.add(fcurve, frame, value, interpolation)
+
+        if decimate and self.decimate_tolerance is not None:
+            if fcurve not in self.decimate_frames:
+                self.decimate_frames[fcurve] = set()
+            self.decimate_frames[fcurve].update(frames)
+
+    def add_previous_frames(self, fcurve, frames):
+        # Frames that an earlier run wrote keys on. When we write, the keys on any of these frames that we aren't
+        # writing this time are removed, so an old vibration doesn't end up mixed in with the new one.
+        self.previous_frames[fcurve] = set(frames)
+
+    def write(self):
+        # Write everything we've collected. Returns the number of keys written; keys that are already on the F-curve
+        # with the same value (and interpolation) are left alone and aren't counted, and neither are the keys that were
+        # decimated. Afterwards, written_frames holds the frames of each F-curve whose keys are ours: the ones we just
+        # wrote, plus the previous frames we would have written but that already had the right key.
+        number_of_keys_written = 0
+        self.written_frames = {}
+        self.number_of_keys_unchanged = 0
+        self.number_of_keys_removed = 0
+        self.number_of_keys_decimated = 0
+        self.number_of_fcurves_changed = 0
+        for fcurve, keys in self.keys.items():
+            previous_frames = self.previous_frames.get(fcurve, set())
+            decimate_frames = self.decimate_frames.get(fcurve, set())
+            kept_frames, written_frames, number_of_keys_removed = write_keys(fcurve, keys, self.default_interpolation, previous_frames,
+                                                                             decimate_frames, self.decimate_tolerance)
+
+            frames = set(written_frames)
+            frames.update(previous_frames.intersection(kept_frames))
+            self.written_frames[fcurve] = sorted(frames)
+            number_of_keys_written += len(written_frames)
+            self.number_of_keys_unchanged += len(kept_frames) - len(written_frames)
+            self.number_of_keys_removed += number_of_keys_removed
+            self.number_of_keys_decimated += len(keys) - len(kept_frames)
+            if len(written_frames) > 0 or number_of_keys_removed > 0:
+                self.number_of_fcurves_changed += 1
+
+        self.keys = {}
+        self.previous_frames = {}
+        self.decimate_frames = {}
+        return number_of_keys_written
+
+def decimate_keys(keys, decimate_frames, previous_frames, co, interpolation, tolerance):
+    # Drop the keys on decimate_frames that don't change the curve: a CONSTANT key whose value is within tolerance of
+    # the key before it, when that key is CONSTANT too (so it's already holding that value). We go through the curve
+    # as it will be once the keys are written, comparing each key with the last one we kept, so small differences
+    # can't add up. Keys that were on the curve before and aren't ours (see write_keys()) are never dropped.
+    # Returns the keys we're keeping.
+    constant = interpolation_value('CONSTANT')
+    existing_keys = dict(zip(co[0::2].tolist(), zip(co[1::2].tolist(), interpolation.tolist())))
+
+    curve = {}  # {frame: (value, interpolation, can be dropped)}
+    for frame, (value, key_interpolation) in existing_keys.items():
+        if frame in previous_frames and frame not in keys:
+            continue  # An old key of ours that's going away.
+        curve[frame] = (value, key_interpolation, False)
+    for frame, (value, key_interpolation) in keys.items():
+        existing_key = existing_keys.get(frame)
+        if key_interpolation is not None:
+            key_interpolation = interpolation_value(key_interpolation)
+        elif existing_key is not None:
+            key_interpolation = existing_key[1]
+        else:
+            key_interpolation = None  # The default interpolation, which we don't need to know.
+        droppable = frame in decimate_frames and (existing_key is None or frame in previous_frames)
+        curve[frame] = (value, key_interpolation, droppable)
+
+    keys = dict(keys)
+    last_key = None
+    for frame in sorted(curve):
+        value, key_interpolation, droppable = curve[frame]
+        if (droppable and last_key is not None and last_key[1] == constant and key_interpolation == constant
+                and abs(value - last_key[0]) <= tolerance):
+            del keys[frame]
+        else:
+            last_key = (value, key_interpolation)
+    return keys
+
+def write_keys(fcurve, keys, default_interpolation, previous_frames=(), decimate_frames=(), decimate_tolerance=None):
+    # keys is a dictionary of {frame: (value, interpolation)}.
+    # A key on a frame that already has a keyframe replaces that keyframe's value (keeping its handle types, just
+    # like inserting a key over an existing one does); every other key is appended. The interpolation of every key
+    # is set in the same sweep, so there's no need to go looking for the keys we wrote afterwards. Keyframes that
+    # already have the value (and interpolation) we want are left as they are, and keyframes on any of
+    # previous_frames that aren't in keys are removed. If there's a decimate_tolerance, redundant keys on any of
+    # decimate_frames are dropped first (see decimate_keys()). If nothing needs changing, the F-curve isn't touched
+    # at all.
+    # Returns (the frames of keys that we kept, the frames that were written, the number of keyframes removed).
+    keyframe_points = fcurve.keyframe_points
+    old_count = len(keyframe_points)
+
+    co = np.empty(old_count * 2, dtype=np.float32)
+    handle_left = np.empty(old_count * 2, dtype=np.float32)
+    handle_right = np.empty(old_count * 2, dtype=np.float32)
+    interpolation = np.empty(old_count, dtype=np.int32)
+    keyframe_points.foreach_get('co', co)
+    keyframe_points.foreach_get('handle_left', handle_left)
+    keyframe_points.foreach_get('handle_right', handle_right)
+    keyframe_points.foreach_get('interpolation', interpolation)
+
+    if decimate_tolerance is not None and len(decimate_frames) > 0:
+        keys = decimate_keys(keys, decimate_frames, previous_frames, co, interpolation, decimate_tolerance)
+
+    # Remove the keys from the last run that we aren't replacing, last one first so the indices stay valid. There's
+    # no bulk way to do this, but there are only ever a handful unless the vibration has moved.
+    remove = [i for i, frame in enumerate(co[0::2].tolist()) if frame in previous_frames and frame not in keys]
+    for i in reversed(remove):
+        keyframe_points.remove(keyframe_points[i], fast=True)
+    if len(remove) > 0:
+        co = np.delete(co.reshape(-1, 2), remove, axis=0).reshape(-1)
+        handle_left = np.delete(handle_left.reshape(-1, 2), remove, axis=0).reshape(-1)
+        handle_right = np.delete(handle_right.reshape(-1, 2), remove, axis=0).reshape(-1)
+        interpolation = np.delete(interpolation, remove)
+        old_count -= len(remove)
+
+    existing_keys = dict(zip(co[0::2].tolist(), range(old_count)))  # {frame: index of the keyframe on that frame}
+
+    written_frames = []
+    new_frames = []
+    new_values = []
+    new_interpolation = []
+    for frame, (value, key_interpolation) in keys.items():
+        i = existing_keys.get(frame)
+        if i is None:
+            new_frames.append(frame)
+            new_values.append(value)
+            new_interpolation.append(interpolation_value(key_interpolation or default_interpolation))
+            written_frames.append(frame)
+            continue
+
+        value = np.float32(value)
+        if co[i * 2 + 1] == value and (key_interpolation is None or interpolation[i] == interpolation_value(key_interpolation)):
+            continue  # It's already the key we want.
+
+        # Move the existing keyframe (and its handles) to the new value.
+        delta = value - co[i * 2 + 1]
+        co[i * 2 + 1] = value
+        handle_left[i * 2 + 1] += delta
+        handle_right[i * 2 + 1] += delta
+        if key_interpolation is not None:
+            interpolation[i] = interpolation_value(key_interpolation)
+        written_frames.append(frame)
+
+    if len(written_frames) == 0 and len(remove) == 0:
+        return (list(keys), written_frames, 0)
+
+    new_count = len(new_frames)
+    if new_count > 0:
+        new_co = np.empty(new_count * 2, dtype=np.float32)
+        new_co[0::2] = new_frames
+        new_co[1::2] = new_values
+
+        co = np.concatenate((co, new_co))
+        handle_left = np.concatenate((handle_left, new_co))  # update() recalculates the handles of the new keys.
+        handle_right = np.concatenate((handle_right, new_co))
+        interpolation = np.concatenate((interpolation, np.array(new_interpolation, dtype=np.int32)))
+
+        keyframe_points.add(new_count)
+
+    keyframe_points.foreach_set('co', co)
+    keyframe_points.foreach_set('handle_left', handle_left)
+    keyframe_points.foreach_set('handle_right', handle_right)
+    keyframe_points.foreach_set('interpolation', interpolation)
+    fcurve.update()
+
+    return (list(keys), written_frames, len(remove))
@@ -0,0 +1,147 @@
+#====================== BEGIN GPL LICENSE BLOCK ======================
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+#======================= END GPL LICENSE BLOCK ========================
+
+###############################################################################
+# Batch driver: vibrates many .blend files at once, each one in its own
+# background Blender, and writes a JSON summary of how every job went.
+#
+#   python scripts/batch_vibrate.py batch.json [--processes 4] [--blender blender] [--summary summary.json]
+#
+# batch.json (or .yaml, if PyYAML is available) is a list of jobs, each of
+# which is a .blend "file" plus the job settings that good_vibrations/cli.py
+# understands:
+#
+#   {"jobs": [{"file": "shots/sh010.blend", "vibration_object": "Rig", "dest_frame_start": 101},
+#             {"file": "shots/sh020.blend", "vibration_object": "Rig", "dest_frame_start": 240}]}
+#
+# "processes" and "blender" can also be given in the batch file itself.
+# This script doesn't need Blender's Python; plain Python 3 will do.
+###############################################################################
+
+import argparse
+import concurrent.futures
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# The folder that contains the good_vibrations add-on, so background Blenders can import it without it being
+# installed.
+ADDON_PARENT_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BLENDER_PYTHON_EXPR = ("import sys; sys.path.insert(0, {addon_parent_folder!r}); "
+                       "import good_vibrations.cli; sys.exit(good_vibrations.cli.main())")
+
+def load_batch_file(filepath):
+    with open(filepath, 'r') as f:
+        if os.path.splitext(filepath)[1].lower() in ('.yaml', '.yml'):
+            import yaml  # Only needed for YAML batch files, so we don't insist on it.
+            return yaml.safe_load(f)
+        return json.load(f)
+
+def run_job(blender, job, job_number, work_folder):
+    # Run one job in a background Blender. Returns a dictionary describing what happened.
+    job = dict(job)
+    blend_filepath = job.pop('file')
+
+    job_filepath = os.path.join(work_folder, 'job_' + str(job_number) + '.json')
+    result_filepath = os.path.join(work_folder, 'result_' + str(job_number) + '.json')
+    with open(job_filepath, 'w') as f:
+        json.dump(job, f)
+
+    command = [blender, '-b', blend_filepath, '--factory-startup',
+               '--python-exit-code', '1',
+               '--python-expr', BLENDER_PYTHON_EXPR.format(addon_parent_folder=ADDON_PARENT_FOLDER),
+               '--', job_filepath, '--result', result_filepath]
+
+    start_time = time.perf_counter()
+    process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    wall_seconds = time.perf_counter() - start_time
+
+    if os.path.exists(result_filepath):
+        with open(result_filepath, 'r') as f:
+            result = json.load(f)
+    else:
+        # Blender didn't get as far as running the job (bad file, crash, ...).
+        result = {'status': 'error', 'error': 'Blender exited without a result.'}
+
+    result['file'] = blend_filepath
+    result['returncode'] = process.returncode
+    result['wall_seconds'] = wall_seconds
+    if result['status'] != 'ok':
+        result['log'] = process.stdout[-4000:]  # The tail of Blender's output, to see what went wrong.
+
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description='Create Good Vibrations vibrations in many .blend files.')
+    parser.add_argument('batch', help='JSON (or YAML) batch file')
+    parser.add_argument('--processes', type=int, help='how many Blenders to run at once')
+    parser.add_argument('--blender', help='the Blender executable')
+    parser.add_argument('--summary', default='good_vibrations_summary.json', help='where to write the JSON summary')
+    args = parser.parse_args()
+
+    batch = load_batch_file(args.batch)
+    if isinstance(batch, list):
+        batch = {'jobs': batch}
+
+    blender = args.blender or batch.get('blender', 'blender')
+    processes = args.processes or batch.get('processes', os.cpu_count() or 1)
+
+    # Relative .blend paths are relative to the batch file.
+    batch_folder = os.path.dirname(os.path.abspath(args.batch))
+    jobs = []
+    for job in batch['jobs']:
+        job = dict(job)
+        job['file'] = os.path.join(batch_folder, job['file'])
+        if 'output' in job:
+            job['output'] = os.path.join(batch_folder, job['output'])
+        jobs.append(job)
+
+    start_time = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix='good_vibrations_') as work_folder:
+        # Each job runs in its own Blender process; the threads just wait on them.
+        with concurrent.futures.ThreadPoolExecutor(max_workers=processes) as executor:
+            futures = [executor.submit(run_job, blender, job, i, work_folder) for i, job in enumerate(jobs)]
+            results = []
+            for future in futures:
+                result = future.result()
+                print(result['status'].upper() + ': ' + result['file'] + ' (' + str(round(result['wall_seconds'], 2)) + 's)')
+                results.append(result)
+
+    summary = {'batch': os.path.abspath(args.batch),
+               'blender': blender,
+               'processes': processes,
+               'wall_seconds': time.perf_counter() - start_time,
+               'succeeded': sum(1 for result in results if result['status'] == 'ok'),
+               'failed': sum(1 for result in results if result['status'] != 'ok'),
+               'jobs': results}
+
+    with open(args.summary, 'w') as f:
+        json.dump(summary, f, indent=4)
+
+    print(str(summary['succeeded']) + ' succeeded, ' + str(summary['failed']) + ' failed. Summary written to ' + args.summary)
+
+    if summary['failed'] > 0:
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())